@@ -0,0 +1,133 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+"""
+Micro-benchmarks for the marshalling and parsing code in ``txaioetcd._types`` and
+``txaioetcd._client_commons`` that runs for every request. No etcd is needed.
+
+Usage: python bench_types.py [-n NUMBER] [-o OUTPUT_FILE]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+
+from txaioetcd import KeySet, KeyValue, Header, OpSet, OpDel, OpGet, CompModified, Transaction, Param
+from txaioetcd._client_commons import validate_client_submit_response
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+_HEADER = {
+    u'cluster_id': u'14841639068965178418',
+    u'member_id': u'10276657743932975437',
+    u'raft_term': u'2',
+    u'revision': u'1234567',
+}
+
+_KV = {
+    u'key': _b64(b'/txaioetcd/benchmark/00000000000000000001'),
+    u'value': _b64(os.urandom(256)),
+    u'version': u'3',
+    u'create_revision': u'1234000',
+    u'mod_revision': u'1234500',
+}
+
+
+def _txn(size):
+    return Transaction(
+        compare=[CompModified(u'key{}'.format(i).encode(), u'==', 1234500 + i) for i in range(size)],
+        success=[OpSet(u'key{}'.format(i).encode(), os.urandom(256)) for i in range(size)],
+        failure=[OpGet(u'key{}'.format(i).encode()) for i in range(size)])
+
+
+def _prepared(size):
+    prepared = Transaction(
+        compare=[CompModified(u'key{}'.format(i).encode(), u'==', Param(u'rev{}'.format(i))) for i in range(size)],
+        success=[OpSet(u'key{}'.format(i).encode(), Param(u'value{}'.format(i))) for i in range(size)],
+        failure=[OpGet(u'key{}'.format(i).encode()) for i in range(size)]).prepare()
+    params = {u'rev{}'.format(i): 1234500 + i for i in range(size)}
+    params.update({u'value{}'.format(i): os.urandom(256) for i in range(size)})
+    return prepared, params
+
+
+def _submit_response(size):
+    responses = []
+    for i in range(size):
+        responses.append({u'response_put': {u'header': dict(_HEADER)}})
+        responses.append({u'response_range': {u'header': dict(_HEADER), u'kvs': [dict(_KV)], u'count': u'1'}})
+        responses.append({u'response_delete_range': {u'header': dict(_HEADER), u'deleted': u'1'}})
+    return {u'header': dict(_HEADER), u'succeeded': True, u'responses': responses}
+
+
+BENCHMARKS = [
+    ('KeySet._marshal(single)', lambda ks: ks._marshal(), lambda: KeySet(b'/txaioetcd/benchmark/key')),
+    ('KeySet._marshal(prefix)', lambda ks: ks._marshal(),
+     lambda: KeySet(b'/txaioetcd/benchmark/', prefix=True)),
+    ('OpSet()', lambda value: OpSet(b'/txaioetcd/benchmark/key', value), lambda: os.urandom(256)),
+    ('OpSet._marshal', lambda op: op._marshal(), lambda: OpSet(b'/txaioetcd/benchmark/key', os.urandom(256))),
+    ('OpDel._marshal', lambda op: op._marshal(), lambda: OpDel(b'/txaioetcd/benchmark/key')),
+    ('OpGet._marshal', lambda op: op._marshal(), lambda: OpGet(b'/txaioetcd/benchmark/key', limit=10)),
+    ('Transaction._marshal(64)', lambda txn: txn._marshal(), lambda: _txn(64)),
+    ('Transaction._marshal(64)+json', lambda txn: json.dumps(txn._marshal()), lambda: _txn(64)),
+    ('PreparedTransaction.bind(64)', lambda prepared: prepared[0].bind(**prepared[1])._encode(),
+     lambda: _prepared(64)),
+    ('KeyValue._parse', lambda obj: KeyValue._parse(obj), lambda: dict(_KV)),
+    ('Header._parse', lambda obj: Header._parse(obj), lambda: dict(_HEADER)),
+    ('validate_client_submit_response(3x64)', lambda obj: validate_client_submit_response(obj),
+     lambda: _submit_response(64)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for txaioetcd marshalling and parsing.')
+    parser.add_argument('-n', '--number', type=int, default=10000, help='Iterations per benchmark.')
+    parser.add_argument('-o', '--output-file', help='Path for the JSON results (default: none).')
+    args = parser.parse_args()
+
+    results = {}
+    for name, func, setup in BENCHMARKS:
+        arg = setup()
+        number = args.number if '64' not in name else args.number // 100
+        number = max(number, 10)
+        timer = timeit.Timer(lambda: func(arg))
+        best = min(timer.repeat(repeat=5, number=number)) / number
+        results[name] = best * 1e6
+        print('{:<45} {:>10.3f} us'.format(name, best * 1e6), file=sys.stderr)
+
+    if args.output_file:
+        with open(args.output_file, 'w') as f:
+            json.dump({u'results_us': results}, f, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+"""
+Compare two benchmark reports written by ``etcd-benchmark``.
+
+Usage: python compare.py BASELINE.json CANDIDATE.json
+"""
+
+import json
+import sys
+
+
+def _load(filename):
+    with open(filename) as f:
+        report = json.load(f)
+    results = {}
+    for res in report[u'results']:
+        marker = (res[u'scenario'], json.dumps(res[u'params'], sort_keys=True))
+        results[marker] = res
+    return report, results
+
+
+def _change(old, new):
+    if not old or new is None:
+        return u'     n/a'
+    return u'{:+7.1f}%'.format((new - old) / old * 100.)
+
+
+def main(baseline, candidate):
+    report1, results1 = _load(baseline)
+    report2, results2 = _load(candidate)
+
+    print('baseline:  {} ({})'.format(report1[u'label'], baseline))
+    print('candidate: {} ({})'.format(report2[u'label'], candidate))
+    print('')
+    print('{:<8} {:<72} {:>9} {:>9} {:>9} {:>9}'.format('scenario', 'params', 'ops/s', 'p50', 'p99',
+                                                        'p99.9'))
+    for marker in sorted(results1):
+        if marker not in results2:
+            continue
+        res1, res2 = results1[marker], results2[marker]
+        # failed runs carry an error instead of results
+        lat1, lat2 = res1.get(u'latency_ms', {}), res2.get(u'latency_ms', {})
+        print('{:<8} {:<72} {:>9} {:>9} {:>9} {:>9}'.format(
+            marker[0], marker[1], _change(res1.get(u'ops_per_sec'), res2.get(u'ops_per_sec')),
+            _change(lat1.get(u'p50'), lat2.get(u'p50')), _change(lat1.get(u'p99'), lat2.get(u'p99')),
+            _change(lat1.get(u'p999'), lat2.get(u'p999'))))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(__doc__.strip())
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2])
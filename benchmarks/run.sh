@@ -0,0 +1,33 @@
+#!/usr/bin/env bash
+
+# Run the end-to-end benchmark sweep against the etcd given in ETCD_URL (default:
+# http://localhost:2379) and store the results labeled with the current git commit.
+#
+# Compare two runs with:
+#
+#   python compare.py results/<commit1>.json results/<commit2>.json
+
+ETCD_URL=${ETCD_URL:-http://localhost:2379}
+LABEL=${LABEL:-$(git rev-parse --short HEAD)}
+
+mkdir -p results
+
+echo "*******************************************************************"
+echo "RUNNING ON:"
+python -V
+echo "ETCD:  ${ETCD_URL}"
+echo "LABEL: ${LABEL}"
+echo ""
+
+etcd-benchmark \
+    --address ${ETCD_URL} \
+    --ops 2000 \
+    --concurrency 1,8,32 \
+    --key-size 32,128 \
+    --value-size 16,1024,16384 \
+    --batch-size 1,16,64 \
+    --label ${LABEL} \
+    --output-file results/${LABEL}.json \
+    --verbose
+
+echo "*******************************************************************"
@@ -0,0 +1,78 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+from twisted.internet.task import react
+from twisted.internet.defer import inlineCallbacks
+
+import txaio
+from txaioetcd import Client, KeySet
+
+
+@inlineCallbacks
+def main(reactor):
+
+    etcd = Client(reactor)
+
+    yield etcd.delete(KeySet(b'cas/', prefix=True))
+
+    # create 200 keys: more than fit into a single etcd transaction
+    updates = {u'cas/{:04d}'.format(i).encode(): b'0' for i in range(200)}
+    result = yield etcd.cas_many(updates, {key: 0 for key in updates})
+    print(result)
+    assert result.succeeded and len(result.applied) == 200
+
+    # read the keys and remember their revisions
+    result = yield etcd.get(KeySet(b'cas/', prefix=True))
+    revisions = {kv.key: kv.mod_revision for kv in result.kvs}
+
+    # somebody else modifies one of the keys ..
+    yield etcd.set(b'cas/0042', b'666')
+
+    # .. so our update fails, and we get the current value of the key that changed
+    updates = {key: b'1' for key in revisions}
+    result = yield etcd.cas_many(updates, revisions)
+    print(result)
+    assert not result.succeeded
+    assert list(result.conflicts.keys()) == [b'cas/0042']
+    assert result.conflicts[b'cas/0042'].value == b'666'
+
+    # retry with the revision we got back: no extra read is needed
+    revisions[b'cas/0042'] = result.conflicts[b'cas/0042'].mod_revision
+    updates = {key: b'1' for key in revisions if key not in result.applied}
+    result = yield etcd.cas_many(updates, revisions)
+    print(result)
+    assert result.succeeded
+
+    result = yield etcd.get(KeySet(b'cas/', prefix=True))
+    assert all(kv.value == b'1' for kv in result.kvs)
+
+    yield etcd.delete(KeySet(b'cas/', prefix=True))
+
+
+if __name__ == '__main__':
+    txaio.start_logging(level='info')
+    react(main)
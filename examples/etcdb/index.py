@@ -21,6 +21,10 @@ async def main(reactor):
     idx_users_by_email = MapStringUuid(3)
     tab_users.attach_index(idx_users_by_email, lambda user: user.email)
 
+    # non-unique index with multiple index keys (tags) per user
+    idx_users_by_tag = MapStringUuid(4)
+    index_by_tag = tab_users.attach_index(idx_users_by_tag, lambda user: user.tags, unique=False, multi=True)
+
     db = Database(Client(reactor))
     revision = await db.status()
     print('connected to etcd: revision', revision)
@@ -45,6 +49,10 @@ async def main(reactor):
 
             user_oid = await idx_users_by_email[txn, user.email]
             assert user_oid == user.oid
+
+            for tag in user.tags:
+                user_oids = await index_by_tag.lookup(txn, tag)
+                assert user.oid in user_oids
         print('index lookups successful')
 
     async with db.begin(write=True) as txn:
@@ -69,6 +77,10 @@ async def main(reactor):
 
                 user_oid = await idx_users_by_email[txn, user.email]
                 assert user_oid is None
+
+                for tag in user.tags:
+                    user_oids = await index_by_tag.lookup(txn, tag)
+                    assert user.oid not in user_oids
             else:
                 assert _user
                 assert _user == user
@@ -81,6 +93,30 @@ async def main(reactor):
 
             print('database structure for user oid={} verified successfully'.format(user.oid))
 
+    # records without index keys (here: without tags) are not indexed
+    async with db.begin(write=True) as txn:
+        untagged = User.create_test_user(name='untagged')
+        untagged.tags = None
+        tab_users[txn, untagged.oid] = untagged
+
+    async with db.begin() as txn:
+        assert await tab_users[txn, untagged.oid] == untagged
+        assert await idx_users_by_name[txn, untagged.name] == untagged.oid
+        print('user without tags stored: oid={}'.format(untagged.oid))
+
+    # the index writes of a record count in the limits of a transaction: a transaction
+    # with too many indexed records fails on the put exceeding the limits, not on commit
+    puts = 0
+    try:
+        async with db.begin(write=True) as txn:
+            for i in range(100):
+                user = User.create_test_user(name='toomany{}'.format(i))
+                tab_users[txn, user.oid] = user
+                puts += 1
+    except Exception as e:
+        print('transaction too large after {} users: {}'.format(puts, e))
+    assert 0 < puts < 100
+
     print('etcd stats', db.stats())
 
 
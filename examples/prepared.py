@@ -0,0 +1,78 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+from twisted.internet.task import react
+from twisted.internet.defer import inlineCallbacks
+
+import txaio
+from txaioetcd import Client, Transaction, Param, CompModified, OpSet, OpGet, Failed
+
+
+@inlineCallbacks
+def main(reactor):
+
+    etcd = Client(reactor)
+
+    yield etcd.set(b'counter', b'0')
+
+    # a compare-and-swap transaction that is validated and encoded only once:
+    # the revision to compare and the value to set are filled in on each submit
+    cas = Transaction(
+        compare=[CompModified(b'counter', '==', Param('revision'))],
+        success=[OpSet(b'counter', Param('value'))],
+        failure=[OpGet(b'counter')]).prepare()
+
+    print('prepared transaction with parameters {}'.format(sorted(cas.params)))
+
+    result = yield etcd.get(b'counter')
+    kv = result.kvs[0]
+
+    for i in range(10):
+        counter = int(kv.value) + 1
+        try:
+            result = yield etcd.submit(cas.bind(revision=kv.mod_revision, value=str(counter).encode()))
+        except Failed as failed:
+            # somebody else modified the counter: retry with the current value
+            kv = failed.responses[0].kvs[0]
+        else:
+            kv.value = str(counter).encode()
+            kv.mod_revision = result.header.revision
+
+    # provoke a conflict: the revision we compare to is outdated
+    try:
+        yield etcd.submit(cas.bind(revision=kv.mod_revision - 1, value=b'666'))
+    except Failed as failed:
+        print('transaction FAILED as expected, current value: {}'.format(failed.responses[0].kvs[0].value))
+
+    result = yield etcd.get(b'counter')
+    print('counter: {}'.format(result.kvs[0].value))
+    assert result.kvs[0].value == b'10'
+
+
+if __name__ == '__main__':
+    txaio.start_logging(level='info')
+    react(main)
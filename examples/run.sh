@@ -8,6 +8,8 @@ echo ""
 python connect.py
 python crud.py
 python transaction.py
+python prepared.py
+python cas.py
 python lease.py
 python watch.py
 
@@ -114,7 +114,8 @@ setup(
     entry_points={
         'console_scripts': [
             'etcd-export = txaioetcd.cli.exporter:main',
-            'etcd-import = txaioetcd.cli.importer:main'
+            'etcd-import = txaioetcd.cli.importer:main',
+            'etcd-benchmark = txaioetcd.cli.benchmark:main'
         ]
     },
 )
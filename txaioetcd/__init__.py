@@ -29,10 +29,10 @@ from __future__ import absolute_import
 from txaioetcd._version import __version__
 
 from txaioetcd._types import KeySet, KeyValue, Header, Status, \
-    Deleted, Revision, \
+    Deleted, Revision, WatchEvent, WatchResponse, \
     Comp, CompValue, CompVersion, CompCreated, CompModified, \
-    Op, OpGet, OpSet, OpDel, Transaction, Expired, Error, Failed, Success, \
-    Range
+    Op, OpGet, OpSet, OpDel, Transaction, Param, PreparedTransaction, Expired, Error, Failed, Success, \
+    Range, CasResult
 
 from txaioetcd._pmap import MapSlotUuidUuid, \
                             MapUuidString, \
@@ -45,6 +45,7 @@ from txaioetcd._pmap import MapSlotUuidUuid, \
                             MapUuidUuidCbor, \
                             MapUuidUuidSet, \
                             MapUuidStringUuid, \
+                            MapUuidUuidUuid, \
                             MapStringString, \
                             MapStringOid, \
                             MapStringUuid, \
@@ -60,7 +61,7 @@ from txaioetcd._pmap import MapSlotUuidUuid, \
                             MapOidPickle, \
                             MapOidFlatBuffers
 
-from txaioetcd._database import Database, DbTransaction, DbTransactionStats
+from txaioetcd._database import Database, DbTransaction, DbTransactionStats, DatabaseStats
 from txaioetcd._lease import Lease
 
 from txaioetcd._client_tx import Client
@@ -68,12 +69,15 @@ from txaioetcd._client_tx import Client
 # from txaioetcd._client_pg import Client as ClientPg
 
 # This is the complete public API of txaioetcd:
-__all__ = ('__version__', 'Client', 'Transaction', 'Lease', 'KeyValue', 'KeySet', 'Header', 'Status', 'Range',
-           'Revision', 'Deleted', 'Error', 'Failed', 'Success', 'Expired', 'Comp', 'CompValue', 'CompVersion',
-           'CompCreated', 'CompModified', 'Op', 'OpGet', 'OpSet', 'OpDel', 'Database', 'DbTransaction',
-           'DbTransactionStats', 'MapSlotUuidUuid', 'MapUuidString', 'MapUuidOid', 'MapUuidUuid',
+__all__ = ('__version__', 'Client', 'Transaction', 'Param', 'PreparedTransaction', 'Lease', 'KeyValue',
+           'KeySet', 'Header', 'Status', 'Range', 'Revision', 'Deleted', 'WatchEvent', 'WatchResponse', 'Error',
+           'Failed', 'Success', 'Expired',
+           'Comp', 'CompValue', 'CompVersion', 'CompCreated', 'CompModified', 'Op', 'OpGet', 'OpSet', 'OpDel',
+           'CasResult', 'Database', 'DbTransaction',
+           'DbTransactionStats', 'DatabaseStats', 'MapSlotUuidUuid', 'MapUuidString', 'MapUuidOid', 'MapUuidUuid',
            'MapUuidJson', 'MapUuidCbor', 'MapUuidPickle', 'MapUuidFlatBuffers', 'MapUuidUuidCbor',
-           'MapUuidUuidSet', 'MapUuidStringUuid', 'MapStringString', 'MapStringOid', 'MapStringUuid',
+           'MapUuidUuidSet', 'MapUuidStringUuid', 'MapUuidUuidUuid', 'MapStringString', 'MapStringOid',
+           'MapStringUuid',
            'MapStringJson', 'MapStringCbor', 'MapStringPickle', 'MapStringFlatBuffers', 'MapOidString',
            'MapOidOid', 'MapOidUuid', 'MapOidJson', 'MapOidCbor', 'MapOidPickle', 'MapOidFlatBuffers')
 
@@ -31,7 +31,7 @@ import os
 import six
 
 from txaioetcd import Status, Deleted, Revision, \
-    Failed, Success, Range, Lease
+    Failed, Success, Range, Lease, CasResult
 from txaioetcd import _client_commons as commons
 
 __all__ = ('Client', )
@@ -67,7 +67,14 @@ if HAS_AIO:
             self._timeout = timeout
 
         async def _post(self, url, data, timeout):
-            response = await self._session.post(url, json=data, timeout=timeout)
+            if type(data) == six.binary_type:
+                # request bodies already encoded (eg of prepared transactions) are posted as is
+                response = await self._session.post(url,
+                                                    data=data,
+                                                    headers={u'Content-Type': u'application/json'},
+                                                    timeout=timeout)
+            else:
+                response = await self._session.post(url, json=data, timeout=timeout)
             return await response.json()
 
         async def status(self, timeout=None):
@@ -165,7 +172,19 @@ if HAS_AIO:
             :param timeout: Request timeout in seconds.
             :type timeout: int or None
             """
-            assembler = commons.GetRequestAssembler(self._url, key, range_end)
+            assembler = commons.GetRequestAssembler(self._url,
+                                                    key,
+                                                    range_end,
+                                                    count_only=count_only,
+                                                    keys_only=keys_only,
+                                                    limit=limit,
+                                                    max_create_revision=max_create_revision,
+                                                    min_create_revision=min_create_revision,
+                                                    min_mod_revision=min_mod_revision,
+                                                    revision=revision,
+                                                    serializable=serializable,
+                                                    sort_order=sort_order,
+                                                    sort_target=sort_target)
 
             obj = await self._post(assembler.url, assembler.data, timeout)
 
@@ -182,8 +201,8 @@ if HAS_AIO:
             raise Exception('not implemented')
 
         async def submit(self, txn, timeout=None):
-            url = commons.ENDPOINT_SUBMIT.format(self._url).encode()
-            data = txn._marshal()
+            url = commons.ENDPOINT_SUBMIT.format(self._url)
+            data = txn._encode()
 
             obj = await self._post(url, data, timeout)
 
@@ -194,6 +213,25 @@ if HAS_AIO:
             else:
                 raise Failed(header, responses)
 
+        async def cas_many(self, updates, expected_revisions, lease=None, max_txn_ops=None, timeout=None):
+            commons.validate_client_cas_parameters(updates, expected_revisions, lease)
+
+            txns = commons.assemble_cas_transactions(updates, expected_revisions, lease, max_txn_ops)
+
+            applied = []
+            revision = None
+            for updated, guarded, txn in txns:
+                try:
+                    result = await self.submit(txn, timeout=timeout)
+                except Failed as fail:
+                    conflicts = commons.parse_cas_conflicts(guarded, expected_revisions, fail.responses)
+                    return CasResult(False, revision, applied, conflicts)
+                else:
+                    revision = result.header.revision
+                    applied.extend(updated)
+
+            return CasResult(True, revision, applied, {})
+
         async def lease(self, time_to_live, lease_id=None, timeout=None):
             assembler = commons.LeaseRequestAssembler(self._url, time_to_live, lease_id)
 
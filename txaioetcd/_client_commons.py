@@ -24,12 +24,11 @@
 #
 ###############################################################################
 
-import base64
-
 import six
 
-from txaioetcd import Lease, KeySet, Error, Revision, Deleted, Range, Header
-from txaioetcd._types import _increment_last_byte
+from txaioetcd import Lease, KeySet, Error, Revision, Deleted, Range, Header, \
+    Transaction, CompModified, OpSet, OpDel, OpGet
+from txaioetcd._types import _increment_last_byte, _b64encode, MAX_TXN_OPS, MAX_REQUEST_BYTES
 
 ENDPOINT_STATUS = '{}/v3alpha/maintenance/status'
 ENDPOINT_PUT = '{}/v3alpha/kv/put'
@@ -80,8 +79,8 @@ class PutRequestAssembler:
 
     def __assemble(self):
         self._data = {
-            u'key': base64.b64encode(self._key).decode(),
-            u'value': base64.b64encode(self._value).decode()
+            u'key': _b64encode(self._key),
+            u'value': _b64encode(self._value)
         }
         if self._return_previous:
             self._data[u'prev_kv'] = True
@@ -100,9 +99,10 @@ class PutRequestAssembler:
 
 
 class GetRequestAssembler:
-    def __init__(self, root_url, key, range_end=None):
+    def __init__(self, root_url, key, range_end=None, **options):
         self._key = key
         self._range_end = range_end
+        self._options = options
         self._data = None
         self._url = ENDPOINT_GET.format(root_url).encode()
         self.__validate()
@@ -117,11 +117,17 @@ class GetRequestAssembler:
         return self._data
 
     def __assemble(self):
-        self._data = {u'key': base64.b64encode(self._key.key).decode()}
-        if self._range_end:
-            self._data[u'range_end'] = base64.b64encode(self._range_end).decode()
+        if self._options:
+            # range options (limit, revision, ..) are validated and marshalled like in a transaction
+            self._data = OpGet(self._key, **self._options)._marshal()[u'request_range']
+        else:
+            self._data = {u'key': _b64encode(self._key.key)}
+            if self._range_end:
+                self._data[u'range_end'] = _b64encode(self._range_end)
 
     def __validate(self):
+        self._options = {name: value for name, value in self._options.items() if value is not None}
+
         if type(self._key) == six.binary_type:
             if self._range_end:
                 self._key = KeySet(self._key, range_end=self._range_end)
@@ -161,7 +167,7 @@ class DeleteRequestAssembler:
 
     def __assemble(self):
         self._data = {
-            u'key': base64.b64encode(self._key.key).decode(),
+            u'key': _b64encode(self._key.key),
         }
         if self._range_end:
             # range_end is the key following the last key to delete
@@ -173,7 +179,7 @@ class DeleteRequestAssembler:
             # If range_end is '\\0', the range is all keys greater
             # than or equal to the key argument.
             #
-            self._data[u'range_end'] = base64.b64encode(self._range_end).decode()
+            self._data[u'range_end'] = _b64encode(self._range_end)
 
         if self._return_previous:
             # If prev_kv is set, etcd gets the previous key-value pairs
@@ -249,32 +255,145 @@ def validate_client_lease_parameters(time_to_live, lease_id=None):
         raise TypeError('time_to_live must >= 1 second, was {}'.format(time_to_live))
 
 
+_RESPONSE_PARSERS = {
+    u'response_put': Revision._parse,
+    u'response_delete_range': Deleted._parse,
+    u'response_range': Range._parse,
+}
+
+
 def validate_client_submit_response(json):
     if u'error' in json:
         error = Error._parse(json)
         raise error
 
-    if u'header' in json:
-        header = Header._parse(json[u'header'])
+    header_obj = json.get(u'header', None)
+    if header_obj is not None:
+        header = Header._parse(header_obj)
     else:
         header = None
 
     responses = []
-    for r in json.get(u'responses', []):
-        if len(r.keys()) != 1:
+    for r in json.get(u'responses', ()):
+        if len(r) != 1:
             raise Exception('bogus transaction response (multiple response tags in item): {}'.format(json))
 
-        first = list(r.keys())[0]
+        for tag, obj in r.items():
+            parse = _RESPONSE_PARSERS.get(tag, None)
+            if parse is None:
+                raise Exception('response item "{}" bogus or not implemented'.format(tag))
 
-        if first == u'response_put':
-            re = Revision._parse(r[u'response_put'])
-        elif first == u'response_delete_range':
-            re = Deleted._parse(r[u'response_delete_range'])
-        elif first == u'response_range':
-            re = Range._parse(r[u'response_range'])
-        else:
-            raise Exception('response item "{}" bogus or not implemented'.format(first))
+            # all responses in a transaction usually carry the same header as the
+            # transaction itself: only parse the header once in this case
+            if header is not None and obj.get(u'header', None) == header_obj:
+                re = parse(obj, header)
+            else:
+                re = parse(obj)
 
-        responses.append(re)
+            responses.append(re)
 
     return header, responses
+
+
+def validate_client_cas_parameters(updates, expected_revisions, lease=None):
+    if type(updates) != dict:
+        raise TypeError('updates must be a dict, not {}'.format(type(updates)))
+
+    if type(expected_revisions) != dict:
+        raise TypeError('expected_revisions must be a dict, not {}'.format(type(expected_revisions)))
+
+    for key, value in updates.items():
+        if type(key) != six.binary_type:
+            raise TypeError('keys in updates must be bytes, not {}'.format(type(key)))
+        if value is not None and type(value) != six.binary_type:
+            raise TypeError('values in updates must be bytes or None, not {}'.format(type(value)))
+
+    for key, revision in expected_revisions.items():
+        if type(key) != six.binary_type:
+            raise TypeError('keys in expected_revisions must be bytes, not {}'.format(type(key)))
+        if type(revision) not in six.integer_types:
+            raise TypeError('revisions in expected_revisions must be integers, not {}'.format(type(revision)))
+
+    if lease is not None and not isinstance(lease, Lease):
+        raise TypeError('lease must be a Lease object, not {}'.format(type(lease)))
+
+
+def _estimate_cas_size(key, value, guarded):
+    # rough size of the JSON encoded ops for one key: base64 grows data by 4/3, and
+    # every op has some constant overhead for the JSON structure
+    size = (len(key) * 4) // 3 + 64
+    if value is not None:
+        size += (len(value) * 4) // 3
+    if guarded:
+        size += 2 * ((len(key) * 4) // 3 + 64)
+    return size
+
+
+def assemble_cas_transactions(updates, expected_revisions, lease=None, max_txn_ops=None, max_request_bytes=None):
+    """
+    Pack a batched compare-and-swap into as few etcd transactions as the server limits allow.
+
+    Each transaction guards its keys with a modified-revision comparison, writes
+    its updates on success, and reads back the guarded keys on failure.
+
+    :returns: List of ``(updated, guarded, transaction)`` triples, with the keys updated and
+        the guarded keys read on failure (in the order of the failure responses).
+    :rtype: list of tuple
+    """
+    max_txn_ops = max_txn_ops or MAX_TXN_OPS
+    max_request_bytes = max_request_bytes or MAX_REQUEST_BYTES
+
+    keys = sorted(set(updates.keys()) | set(expected_revisions.keys()))
+
+    chunks = []
+    chunk = []
+    chunk_size = 0
+    for key in keys:
+        size = _estimate_cas_size(key, updates.get(key, None), key in expected_revisions)
+        if chunk and (len(chunk) >= max_txn_ops or chunk_size + size > max_request_bytes):
+            chunks.append(chunk)
+            chunk = []
+            chunk_size = 0
+        chunk.append(key)
+        chunk_size += size
+    if chunk:
+        chunks.append(chunk)
+
+    txns = []
+    for chunk in chunks:
+        compare = []
+        success = []
+        failure = []
+        updated = []
+        guarded = []
+        for key in chunk:
+            if key in expected_revisions:
+                compare.append(CompModified._create(key, u'==', expected_revisions[key]))
+                failure.append(OpGet._create(KeySet._create(key)))
+                guarded.append(key)
+            if key in updates:
+                value = updates[key]
+                if value is None:
+                    success.append(OpDel._create(key))
+                else:
+                    success.append(OpSet._create(key, value, lease))
+                updated.append(key)
+        txns.append((updated, guarded, Transaction._create(compare=compare, success=success, failure=failure)))
+
+    return txns
+
+
+def parse_cas_conflicts(guarded, expected_revisions, responses):
+    """
+    Determine the conflicting keys from the failure responses of a batched compare-and-swap.
+
+    :returns: Map of conflicting keys to their current key-value (or None).
+    :rtype: dict
+    """
+    conflicts = {}
+    for key, response in zip(guarded, responses):
+        kv = response.kvs[0] if response.kvs else None
+        current = kv.mod_revision if kv else 0
+        if current != expected_revisions[key]:
+            conflicts[key] = kv
+    return conflicts
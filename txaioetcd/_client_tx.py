@@ -44,7 +44,7 @@ from twisted.web.http_headers import Headers
 import treq
 
 from txaioetcd import KeySet, KeyValue, Status, Deleted, \
-    Revision, Failed, Success, Range, Lease
+    Revision, Failed, Success, Range, Lease, CasResult, WatchResponse
 
 from txaioetcd._types import _increment_last_byte
 from txaioetcd import _client_commons as commons
@@ -114,32 +114,50 @@ class _StreamingReceiver(protocol.Protocol):
     etcd3 (the server) runs - not sure. But Unix newline works for me now.
     """
 
-    def __init__(self, cb, done=None):
+    def __init__(self, cb, done=None, return_events=None):
         """
         :param cb: Callback to fire upon a JSON chunk being received and parsed.
         :type cb: callable
 
         :param done: Deferred to fire when done.
         :type done: t.i.d.Deferred
+
+        :param return_events: Flag to fire the callback with each response (including
+            events without values, eg deletes), instead of with each key-value.
+        :type return_events: bool or None
         """
         self._cb = cb
         self._done = done
+        self._return_events = return_events
+
+        # a JSON piece might be split over multiple chunks
+        self._buf = b''
 
     def dataReceived(self, data):  # noqa
-        for msg in data.split(self.SEP):
+        msgs = (self._buf + data).split(self.SEP)
+        self._buf = msgs.pop()
+        for msg in msgs:
+            if not msg.strip():
+                continue
             try:
                 obj = json.loads(msg.decode('utf8'))
             except Exception as e:
                 self.log.warn('JSON parsing of etcd streaming response from failed: {}'.format(e))
             else:
-                for evt in obj[u'result'].get(u'events', []):
-                    if u'kv' in evt:
-                        kv = KeyValue._parse(evt[u'kv'])
-                        try:
-                            self._cb(kv)
-                        except Exception as e:
-                            self.log.warn('exception raised from etcd watch callback {} swallowed: {}'.format(
-                                self._cb, e))
+                if u'result' not in obj:
+                    self.log.warn('etcd streaming response without result: {}'.format(obj))
+                elif self._return_events:
+                    self._fire(WatchResponse._parse(obj[u'result']))
+                else:
+                    for evt in obj[u'result'].get(u'events', []):
+                        if u'kv' in evt:
+                            self._fire(KeyValue._parse(evt[u'kv']))
+
+    def _fire(self, arg):
+        try:
+            self._cb(arg)
+        except Exception as e:
+            self.log.warn('exception raised from etcd watch callback {} swallowed: {}'.format(self._cb, e))
 
     #   ODD: Trying to use a parameter instead of *args errors out as soon as the
     #        parameter is accessed.
@@ -151,6 +169,12 @@ class _StreamingReceiver(protocol.Protocol):
             self._done.callback(args[0])
             self._done = None
 
+    def _cancel(self, done):
+        # stop receiving when the watch is cancelled (the deferred fails with CancelledError)
+        self._done = None
+        if self.transport:
+            self.transport.stopProducing()
+
 
 class _None(object):
     pass
@@ -164,9 +188,15 @@ class ClientStats(object):
 
     def reset(self):
         self._posts_by_url = {}
+        self._bytes_sent = 0
+        self._bytes_received = 0
 
     def marshal(self):
-        obj = {'posts': self._posts_by_url}
+        obj = {
+            'posts': self._posts_by_url,
+            'bytes_sent': self._bytes_sent,
+            'bytes_received': self._bytes_received,
+        }
         return obj
 
     def log_post(self, url, data, timeout):
@@ -174,6 +204,10 @@ class ClientStats(object):
         if url not in self._posts_by_url:
             self._posts_by_url[url] = 0
         self._posts_by_url[url] += 1
+        self._bytes_sent += len(data)
+
+    def log_response(self, url, data):
+        self._bytes_received += len(data)
 
 
 class Client(object):
@@ -225,10 +259,14 @@ class Client(object):
 
     @inlineCallbacks
     def _post(self, url, data, timeout):
+        if type(data) != six.binary_type:
+            # encode here, so the request size is known (the request body may already be JSON encoded)
+            data = json.dumps(data, separators=(',', ':')).encode('utf8')
         self._stats.log_post(url, data, timeout)
-        response = yield treq.post(url, json=data, timeout=(timeout or self._timeout))
-        json_data = yield treq.json_content(response)
-        returnValue(json_data)
+        response = yield treq.post(url, data, headers=self._REQ_HEADERS, timeout=(timeout or self._timeout))
+        content = yield treq.content(response)
+        self._stats.log_response(url, content)
+        returnValue(json.loads(content.decode('utf8')))
 
     def stats(self):
         return self._stats.marshal()
@@ -372,7 +410,19 @@ class Client(object):
         :param timeout: Request timeout in seconds.
         :type timeout: int or None
         """
-        assembler = commons.GetRequestAssembler(self._url, key, range_end)
+        assembler = commons.GetRequestAssembler(self._url,
+                                                key,
+                                                range_end,
+                                                count_only=count_only,
+                                                keys_only=keys_only,
+                                                limit=limit,
+                                                max_create_revision=max_create_revision,
+                                                min_create_revision=min_create_revision,
+                                                min_mod_revision=min_mod_revision,
+                                                revision=revision,
+                                                serializable=serializable,
+                                                sort_order=sort_order,
+                                                sort_target=sort_target)
 
         obj = yield self._post(assembler.url, assembler.data, timeout)
 
@@ -405,7 +455,7 @@ class Client(object):
 
         returnValue(deleted)
 
-    def watch(self, keys, on_watch, filters=None, start_revision=None, return_previous=None):
+    def watch(self, keys, on_watch, filters=None, start_revision=None, return_previous=None, return_events=None):
         """
         Watch one or more keys or key sets and invoke a callback.
 
@@ -427,11 +477,16 @@ class Client(object):
 
         :param return_previous: Flag to request returning previous values.
 
+        :param return_events: Flag to invoke the callback with each response received
+            (an instance of :class:`txaioetcd.WatchResponse`, with the types of the events,
+            the previous values if requested, and the revision of the response), instead of
+            with the key-value of each event.
+
         :returns: A deferred that just fires when watching has started successfully,
             or which fires with an error in case the watching could not be started.
         :rtype: twisted.internet.Deferred
         """
-        d = self._start_watching(keys, on_watch, filters, start_revision, return_previous)
+        d = self._start_watching(keys, on_watch, filters, start_revision, return_previous, return_events)
 
         #
         #   ODD: Trying to use a parameter instead of *args errors out as soon as the
@@ -445,7 +500,7 @@ class Client(object):
         d.addErrback(on_err)
         return d
 
-    def _start_watching(self, keys, on_watch, filters, start_revision, return_previous):
+    def _start_watching(self, keys, on_watch, filters, start_revision, return_previous, return_events):
         data = []
         headers = dict()
         url = ENDPOINT_WATCH.format(self._url).encode()
@@ -511,8 +566,9 @@ class Client(object):
 
         def handle_response(response):
             if response.code == 200:
-                done = Deferred()
-                response.deliverBody(_StreamingReceiver(on_watch, done))
+                receiver = _StreamingReceiver(on_watch, return_events=return_events)
+                receiver._done = done = Deferred(receiver._cancel)
+                response.deliverBody(receiver)
                 return done
             else:
                 raise Exception('unexpected response status {}'.format(response.code))
@@ -563,7 +619,8 @@ class Client(object):
         3. A list of database operations called f op. Like t op, but
            executed if guard evaluates to false.
 
-        :param txn: The transaction to submit.
+        :param txn: The transaction to submit, or a prepared transaction with
+            values bound (see :meth:`txaioetcd.PreparedTransaction.bind`).
         :type txn: instance of :class:`txaioetcd.Transaction`
 
         :param timeout: Request timeout in seconds.
@@ -575,7 +632,7 @@ class Client(object):
             :class:`txaioetcd.Failed` or :class:`txaioetcd.Error`
         """
         url = ENDPOINT_SUBMIT.format(self._url).encode()
-        data = txn._marshal()
+        data = txn._encode()
 
         obj = yield self._post(url, data, timeout)
 
@@ -586,6 +643,59 @@ class Client(object):
         else:
             raise Failed(header, responses)
 
+    @inlineCallbacks
+    def cas_many(self, updates, expected_revisions, lease=None, max_txn_ops=None, timeout=None):
+        """
+        Update multiple keys, provided none of the guarded keys has changed.
+
+        The updates are packed into as few transactions as the etcd limits on
+        operations and request size allow. Each transaction guards its keys by
+        modification revision, and on failure reads back the current values of
+        its guarded keys in the same round trip.
+
+        .. note::
+            When the updates do not fit into a single transaction, the
+            transactions are submitted in order and the first failing one stops
+            the batch. Transactions submitted before remain applied.
+
+        :param updates: Map of keys to new values. A value of ``None`` deletes the key.
+        :type updates: dict of bytes
+
+        :param expected_revisions: Map of keys to the modification revision the key
+            is expected to have. A revision of ``0`` expects the key not to exist.
+        :type expected_revisions: dict of int
+
+        :param lease: Optional lease to attach to the keys written.
+        :type lease: instance of :class:`txaioetcd.Lease` or None
+
+        :param max_txn_ops: Maximum number of operations per transaction (default
+            is the etcd default, :data:`txaioetcd._types.MAX_TXN_OPS`).
+        :type max_txn_ops: int or None
+
+        :param timeout: Request timeout in seconds.
+        :type timeout: int
+
+        :returns: The result, including the conflicting keys with their current values.
+        :rtype: instance of :class:`txaioetcd.CasResult`
+        """
+        commons.validate_client_cas_parameters(updates, expected_revisions, lease)
+
+        txns = commons.assemble_cas_transactions(updates, expected_revisions, lease, max_txn_ops)
+
+        applied = []
+        revision = None
+        for updated, guarded, txn in txns:
+            try:
+                result = yield self.submit(txn, timeout=timeout)
+            except Failed as fail:
+                conflicts = commons.parse_cas_conflicts(guarded, expected_revisions, fail.responses)
+                returnValue(CasResult(False, revision, applied, conflicts))
+            else:
+                revision = result.header.revision
+                applied.extend(updated)
+
+        returnValue(CasResult(True, revision, applied, {}))
+
     @inlineCallbacks
     def lease(self, time_to_live, lease_id=None, timeout=None):
         """
@@ -28,6 +28,8 @@ from __future__ import absolute_import
 
 import sys
 import time
+import bisect
+import random
 import struct
 import uuid
 from pprint import pformat
@@ -36,6 +38,7 @@ import six
 import cbor2
 
 from twisted.python.reflect import qual
+from twisted.internet.defer import DeferredList, ensureDeferred, gatherResults
 
 import txaio
 from txaioetcd import _types, _pmap
@@ -60,11 +63,28 @@ else:
 txaio.use_twisted()
 
 
+def _estimate_size(key, data):
+    """
+    Estimate the size of a write operation in an etcd transaction request: keys
+    and values are sent base64 encoded, plus some JSON overhead.
+    """
+    return (4 * (len(key) + len(data or b''))) // 3 + 64
+
+
 class DbTransactionStats(object):
+    """
+    Statistics of database transactions.
+
+    Times are in seconds. Bytes sent are the (encoded) commit requests, bytes received
+    the keys and values read from etcd.
+    """
+
+    _COUNTERS = ('puts', 'dels', 'reads', 'cache_hits', 'round_trips', 'bytes_sent', 'bytes_received',
+                 'serialize_time', 'deserialize_time', 'compress_time', 'decompress_time', 'commits',
+                 'commit_latency', 'conflicts', 'retries', 'offloads')
+
     def __init__(self):
-        self.puts = 0
-        self.dels = 0
-        self._started = walltime()
+        self.reset()
 
     @property
     def started(self):
@@ -80,17 +100,158 @@ class DbTransactionStats(object):
     def reset(self):
         self.puts = 0
         self.dels = 0
+        self.reads = 0
+        self.cache_hits = 0
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.serialize_time = 0.
+        self.deserialize_time = 0.
+        self.compress_time = 0.
+        self.decompress_time = 0.
+        self.commits = 0
+        self.commit_latency = 0.
+        self.conflicts = 0
+        self.retries = 0
+        self.offloads = 0
         self._started = walltime()
 
+    def add(self, other):
+        """
+        Add the statistics of another transaction to these.
+
+        :param other: The statistics to add.
+        :type other: instance of :class:`txaioetcd.DbTransactionStats`
+        """
+        for name in self._COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def marshal(self):
+        obj = {name: getattr(self, name) for name in self._COUNTERS}
+        obj['duration'] = self.duration
+        return obj
+
+
+class _Histogram(object):
+    """
+    Histogram of values over fixed buckets.
+    """
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        # the last bucket counts values above the largest bound
+        self.buckets = [0] * (len(self._bounds) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.buckets[bisect.bisect_left(self._bounds, value)] += 1
+
+    def marshal(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'buckets': [[bound, count] for bound, count in zip(self._bounds + (None, ), self.buckets)],
+        }
+
+
+class DatabaseStats(object):
+    """
+    Statistics of all transactions run on a database, with histograms of
+    transaction duration, commit latency (both in ms) and commit size (in bytes).
+    """
+
+    LATENCY_BOUNDS = (.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+    """
+    Upper bounds of the histogram buckets for durations and latencies (in ms).
+    """
+
+    SIZE_BOUNDS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+    """
+    Upper bounds of the histogram buckets for commit sizes (in bytes).
+    """
+
+    def __init__(self):
+        self.totals = DbTransactionStats()
+        self.duration = _Histogram(DatabaseStats.LATENCY_BOUNDS)
+        self.commit_latency = _Histogram(DatabaseStats.LATENCY_BOUNDS)
+        self.commit_size = _Histogram(DatabaseStats.SIZE_BOUNDS)
+        self.reset()
+
+    def reset(self):
+        self.transactions = 0
+        self.aborted = 0
+        self.totals.reset()
+        self.duration.reset()
+        self.commit_latency.reset()
+        self.commit_size.reset()
+
+    def add(self, stats, duration, aborted=False):
+        """
+        Add the statistics of a finished transaction.
+
+        :param stats: The statistics of the transaction.
+        :type stats: instance of :class:`txaioetcd.DbTransactionStats`
+
+        :param duration: Duration of the transaction in seconds.
+        :type duration: float
+
+        :param aborted: Flag indicating the transaction was aborted (or failed to commit).
+        :type aborted: bool
+        """
+        self.transactions += 1
+        if aborted:
+            self.aborted += 1
+        self.totals.add(stats)
+        self.duration.add(duration * 1000.)
+        if stats.commits:
+            self.commit_latency.add(stats.commit_latency * 1000.)
+            self.commit_size.add(stats.bytes_sent)
+
+    def marshal(self):
+        obj = {
+            'transactions': self.transactions,
+            'aborted': self.aborted,
+            'totals': self.totals.marshal(),
+            'duration': self.duration.marshal(),
+            'commit_latency': self.commit_latency.marshal(),
+            'commit_size': self.commit_size.marshal(),
+        }
+        return obj
+
 
 class DbTransaction(object):
 
     PUT = 1
     DEL = 2
 
+    OVERSIZE_FAIL = 1
+    """
+    Fail writes that would make the transaction exceed the etcd limits.
+    """
+
+    OVERSIZE_SPLIT = 2
+    """
+    Commit transactions that exceed the etcd limits in multiple etcd transactions (non-atomically).
+    """
+
     log = txaio.make_logger()
 
-    def __init__(self, db, write=False, stats=None, timeout=None):
+    def __init__(self, db, write=False, stats=None, timeout=None, serializable=False, oversize=None,
+                 on_progress=None):
         """
 
         :param db: Etcd database instance this transaction is running for.
@@ -99,136 +260,822 @@ class DbTransaction(object):
         :param write: Set True for a transaction that should be allowed write access.
         :type write: bool
 
-        :param stats: Transaction statistics tracked.
+        :param stats: Transaction statistics tracked: the statistics of this
+            transaction are added when the transaction has finished.
         :type stats: etcd.TransactionStats
 
         :param timeout: Transaction timeout in seconds.
         :type timeout: int
+
+        :param serializable: Set True to read from the etcd member connected to
+            (serializable reads), instead of reading through the cluster leader
+            (linearizable reads). Only allowed for read-only transactions.
+        :type serializable: bool
+
+        :param oversize: What to do when the writes buffered exceed the etcd limits
+            for a single transaction, either ``OVERSIZE_FAIL`` (the default) to fail
+            the write, or ``OVERSIZE_SPLIT`` to commit in multiple etcd transactions.
+            With the latter, the commit is atomic only per etcd transaction: when one
+            fails, the ones committed before remain.
+        :type oversize: int or None
+
+        :param on_progress: For ``OVERSIZE_SPLIT``, called with the number of writes
+            committed and the total number of writes after each etcd transaction.
+        :type on_progress: callable or None
         """
+        if serializable and write:
+            raise Exception('serializable reads only allowed in read-only transactions')
+
+        if oversize not in (None, DbTransaction.OVERSIZE_FAIL, DbTransaction.OVERSIZE_SPLIT):
+            raise Exception('invalid oversize mode {}'.format(oversize))
+
+        assert on_progress is None or callable(on_progress)
+
         self._db = db
 
         self._write = write
-        self._stats = stats
         self._timeout = timeout
+        self._serializable = serializable or None
+        self._oversize = oversize or DbTransaction.OVERSIZE_FAIL
+        self._on_progress = on_progress
 
+        # the snapshot revision all reads in this transaction are pinned to: this is determined
+        # by the first read, and None as long as no read has been done yet
         self._revision = None
         self._committed = None
+
+        # while the first read of the transaction is running: futures of other reads waiting for it
+        self._revision_waiters = None
+
+        # read cache: map of (key, range_end, keys_only, count_only) to results read from etcd.
+        # all reads are at the transaction revision, so cached results never become stale
+        self._cache = None
+
+        # read set: map of keys read from etcd to their modification revision (0 for keys not existing)
+        self._reads = None
+
+        # buffered writes: map of key to (op, data), and the same keys in sorted order
         self._buffer = None
+        self._buffer_keys = None
 
-    def id(self):
-        assert (self._revision is not None)
+        # buffered range deletes: list of disjoint (key, range_end). writes buffered later within
+        # these ranges are in the buffered writes (taking precedence), and earlier ones are dropped
+        self._range_dels = None
+
+        # records written to tables with indexes, for which the index entries are yet to be updated:
+        # map of key to (table, record key, new value or None for deletes, index writes, index bytes)
+        self._index_updates = None
+
+        # estimated size of the etcd transaction request for the buffered writes
+        self._buffer_size = 0
+
+        # estimated number of writes and request size of the index updates yet to be buffered
+        self._index_ops = 0
+        self._index_size = 0
 
+        # wallclock time when the transaction was begun
+        self._started = None
+
+        # statistics of this transaction, and the statistics to add those to when finished
+        self._stats = DbTransactionStats()
+        self._parent_stats = stats
+
+    def id(self):
         return self._revision
 
     @property
     def revision(self):
-        assert (self._revision is not None)
-
-        return self._txn_revision
+        return self._revision
 
     @property
     def committed(self):
-        assert (self._revision is not None)
         return self._committed
 
     async def __aenter__(self):
-        assert (self._revision is None)
+        assert (self._buffer is None and self._revision is None)
 
-        status = await self._db._client.status()
-        self._revision = status.header.revision
+        # no round trip to etcd here: the snapshot revision is either a revision recently seen
+        # by the database (if allowed), or taken from the response to the first read
+        self._revision = self._db._recent_revision()
         self._buffer = {}
+        self._buffer_keys = []
+        self._range_dels = []
+        self._index_updates = {}
+        self._cache = {}
+        self._reads = {}
+        self._started = walltime()
 
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        assert (self._revision is not None)
-
-        # https://docs.python.org/3/reference/datamodel.html#object.__exit__
-        # If the context was exited without an exception, all three arguments will be None.
-        if exc_type is None:
-            if self._buffer:
-                ops = []
-                for key, (op, data) in self._buffer.items():
-                    if op == DbTransaction.PUT:
-                        ops.append(_types.OpSet(key, data))
-                    elif op == DbTransaction.DEL:
-                        ops.append(_types.OpDel(key))
-                    else:
-                        raise Exception('logic error')
-
-                # this implements an optimistic-concurrency-control (OCC) scheme
-                comps = []
-                # for key in self._buffer.keys():
-                #    # modified revision comparison
-                #    comps.append(CompModified(self._txn_revision, '<=', kv.mod_revision))
-
-                # raw etcd transaction
-                txn = _types.Transaction(compare=comps, success=ops, failure=[])
-
-                # commit buffered transaction to etcd
-                res = await self._db._client.submit(txn, timeout=self._timeout)
-                # self._committed = res.header.revision
-                self._committed = res
-
+        assert (self._buffer is not None)
+
+        try:
+            # https://docs.python.org/3/reference/datamodel.html#object.__exit__
+            # If the context was exited without an exception, all three arguments will be None.
+            if exc_type is None:
+                if self._buffer or self._range_dels:
+                    await self._commit()
+                else:
+                    self.log.info(
+                        'DB transaction completed: read only (rev {from_revision})', from_revision=self._revision)
+            else:
+                # transaction aborted: throw away buffered transaction
+                self.log.warn('DB transaction aborted (rev {from_revision})', from_revision=self._revision)
+                self._committed = -1
+        finally:
+            self._db._stats.add(self._stats, walltime() - self._started, aborted=(self._committed == -1))
+            if self._parent_stats:
+                self._parent_stats.add(self._stats)
+
+            # finally: transaction buffer, but not the transaction revision
+            self._buffer = None
+            self._buffer_keys = None
+            self._range_dels = None
+            self._index_updates = None
+            self._buffer_size = 0
+            self._index_ops = 0
+            self._index_size = 0
+            self._cache = None
+            self._reads = None
+
+    def _guards(self):
+        """
+        Build the comparisons guarding the commit of the transaction.
+        """
+        # this implements an optimistic-concurrency-control (OCC) scheme: the
+        # transaction only commits if none of the keys read has been modified since
+        comps = []
+        if len(self._reads) <= self._db._max_txn_ops:
+            for key, mod_revision in self._reads.items():
+                # modified revision comparison
+                comps.append(_types.CompModified._create(key, u'==', mod_revision))
+        else:
+            # too many keys read to guard each: guard ranges of the keys read, such that no key in
+            # the range was created or modified after the transaction revision (this does not detect
+            # keys read that have been deleted since, and may detect changes to keys not read)
+            keys = sorted(self._reads.keys())
+            per_range = -(-len(keys) // self._db._max_txn_ops)
+            for i in range(0, len(keys), per_range):
+                comp = _types.CompModified._create(keys[i], u'<', self._revision + 1)
+                comp.range_end = keys[min(i + per_range, len(keys)) - 1] + b'\0'
+                comps.append(comp)
+        return comps
+
+    def _chunks(self):
+        """
+        Split the buffered writes (in key order) into chunks fitting into etcd transactions.
+        """
+        max_ops = self._db._max_txn_ops
+        max_size = self._db._max_request_bytes
+
+        ops = []
+
+        # etcd rejects writes to keys within a range deleted in the same transaction: leave
+        # out the keys of buffered writes from the range deletes (which come first)
+        for key, range_end in self._range_dels:
+            for _key, _, _ in self._buffered(key, range_end):
+                if key < _key:
+                    ops.append((_types.OpDel._create(_types.KeySet._create(key, range_end=_key)),
+                                _estimate_size(key, _key)))
+                key = _key + b'\0'
+            if range_end == b'\0' or key < range_end:
+                ops.append((_types.OpDel._create(_types.KeySet._create(key, range_end=range_end)),
+                            _estimate_size(key, range_end)))
+
+        for key in self._buffer_keys:
+            op, data = self._buffer[key]
+            if op == DbTransaction.PUT:
+                ops.append((_types.OpSet._create(key, data), _estimate_size(key, data)))
+            elif op == DbTransaction.DEL:
+                ops.append((_types.OpDel._create(key), _estimate_size(key, data)))
+            else:
+                raise Exception('logic error')
+
+        chunks = []
+        chunk = []
+        chunk_size = 0
+        for op, size in ops:
+            if chunk and (len(chunk) >= max_ops or chunk_size + size > max_size):
+                chunks.append(chunk)
+                chunk = []
+                chunk_size = 0
+            chunk.append(op)
+            chunk_size += size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    async def _commit(self):
+        if self._index_updates:
+            await self._flush_index_updates()
+
+        comps = self._guards()
+
+        chunks = self._chunks()
+        total = len(self._buffer) + len(self._range_dels)
+        committed = 0
+        started = walltime()
+
+        # log the individual operations of a sample of the transactions
+        log_ops = self._db._log_ops and random.random() < self._db._log_ops
+
+        for i, ops in enumerate(chunks):
+            # raw etcd transaction: the guards go with the first chunk
+            txn = _types.Transaction._create(compare=(comps if i == 0 else []), success=ops, failure=[])
+
+            # commit buffered transaction to etcd
+            self._stats.round_trips += 1
+            try:
+                if self._db._group_commit is not None and len(chunks) == 1 and not self._range_dels:
+                    # the merged transaction is encoded later: count the estimated size
+                    self._stats.bytes_sent += self._buffer_size
+                    res = await self._db._submit_grouped(txn, self._buffer, self._reads, self._timeout)
+                else:
+                    # encode here to count the exact size
+                    data = txn._encode()
+                    self._stats.bytes_sent += len(data)
+                    res = await self._db._client.submit(_types._EncodedTransaction(data), timeout=self._timeout)
+            except _types.Failed:
                 self.log.info(
-                    'DB transaction committed: {ops} writes (rev {from_revision} to {revision})',
+                    'DB transaction conflict: keys read were modified since rev {from_revision} ({comps} guards)',
                     from_revision=self._revision,
-                    revision=res.header.revision,
-                    ops=len(ops))  # noqa
+                    comps=len(comps))
+                self._stats.conflicts += 1
+                self._committed = -1
+                raise
+
+            # self._committed = res.header.revision
+            self._committed = res
+            self._db._observe_revision(res.header.revision)
+
+            committed += len(ops)
+            if len(chunks) > 1:
+                self.log.debug('DB transaction committed chunk {chunk} of {chunks}: {committed} of {total} writes',
+                               chunk=i + 1,
+                               chunks=len(chunks),
+                               committed=committed,
+                               total=total)
+                if self._on_progress:
+                    self._on_progress(committed, total)
+
+            if log_ops:
+                # the operation is only formatted when the log event is actually emitted
                 for op in ops:
-                    self.log.info('DB {op}', op=str(op))
-            else:
-                self.log.info(
-                    'DB transaction completed: read only (rev {from_revision})', from_revision=self._revision)
+                    self.log.debug('DB {op}', op=op)
+
+        latency = walltime() - started
+        self._stats.commits += 1
+        self._stats.commit_latency += latency
+
+        # one structured log event per commit: the fields can be consumed by log observers as is
+        dels = sum(1 for op, _ in self._buffer.values() if op == DbTransaction.DEL) + len(self._range_dels)
+        self.log.info(
+            'DB transaction committed: {puts} puts, {dels} deletes, {guards} guards, {size} bytes in {chunks} '
+            'etcd transaction(s) (rev {from_revision} to {revision}, {duration} ms)',
+            puts=total - dels,
+            dels=dels,
+            guards=len(comps),
+            size=self._buffer_size,
+            chunks=len(chunks),
+            from_revision=self._revision,
+            revision=self._committed.header.revision,
+            duration=int(round((walltime() - self._started) * 1000.)),
+            latency=int(round(latency * 1000.)))
+
+    async def _read(self, key, range_end=None, keys_only=None, count_only=None, limit=None, reverse=None):
+        """
+        Read from etcd at the transaction revision, or from the read cache.
+        """
+        cache_key = (key, range_end, keys_only, count_only, limit, reverse)
+        if cache_key in self._cache:
+            self._stats.cache_hits += 1
+            return self._cache[cache_key]
+
+        first = await self._begin_read()
+        revision = None
+        self._stats.round_trips += 1
+        try:
+            result = await self._db._client.get(
+                key,
+                range_end=range_end,
+                keys_only=keys_only,
+                count_only=count_only,
+                limit=limit,
+                revision=self._revision,
+                serializable=self._serializable,
+                sort_order=(u'DESCEND' if reverse else None),
+                sort_target=(u'KEY' if reverse else None))
+            revision = result.header.revision
+        finally:
+            self._end_read(first, revision)
+
+        if count_only:
+            res = result.count
+        elif range_end is None:
+            res = self._cache_value(key, result.kvs)
         else:
-            # transaction aborted: throw away buffered transaction
-            self.log.warn('DB transaction aborted (rev {from_revision})', from_revision=self._revision)
-            self._committed = -1
+            res = result.kvs
+            for kv in res:
+                self._reads[kv.key] = kv.mod_revision
+                self._stats.bytes_received += len(kv.key) + len(kv.value or b'')
+            self.log.debug(
+                'etcd from key {from_key} to {to_key}: loaded {cnt} records',
+                from_key=key,
+                to_key=range_end,
+                cnt=len(res))
 
-        # finally: transaction buffer, but not the transaction revision
-        self._buffer = None
+        self._cache[cache_key] = res
+        return res
 
-    async def get(self, key, range_end=None, keys_only=None):
-        assert (self._revision is not None)
+    async def _begin_read(self):
+        """
+        Begin a read from etcd: as long as the snapshot revision of the transaction is not yet known,
+        only one read may run.
 
-        if range_end is None and self._buffer and key in self._buffer:
-            op, data = self._buffer[key]
+        :returns: True, if this is the first read that will fix the snapshot revision.
+        """
+        while self._revision is None and self._revision_waiters is not None:
+            # the first read of this transaction is still running: wait for it to fix the revision
+            waiter = txaio.create_future()
+            self._revision_waiters.append(waiter)
+            await waiter
+
+        first = self._revision is None
+        if first:
+            self._revision_waiters = []
+        return first
+
+    def _end_read(self, first, revision):
+        """
+        End a read from etcd, with the revision of the response (None, if the read failed).
+        """
+        if first:
+            if revision is not None:
+                self._revision = revision
+            waiters, self._revision_waiters = self._revision_waiters, None
+            for waiter in waiters:
+                txaio.resolve(waiter, None)
+        if revision is not None:
+            self._db._observe_revision(revision)
+
+    def _cache_value(self, key, kvs):
+        """
+        Cache the value read for a single key, and add the key to the read set.
+        """
+        if kvs:
+            res = kvs[0].value
+            self._reads[key] = kvs[0].mod_revision
+            self._stats.bytes_received += len(key) + len(res or b'')
+        else:
+            res = None
+            self._reads[key] = 0
+        self._cache[(key, None, None, None, None, None)] = res
+        return res
+
+    async def _prefetch(self, keys, buffered=False, concurrency=None):
+        """
+        Read the values of multiple keys into the read cache, in as few round trips as possible.
+
+        The keys are read in etcd transactions of get operations, and when they do not fit into
+        one etcd transaction, in multiple etcd transactions in parallel (at most ``concurrency``,
+        if given). Keys with buffered writes are only read when ``buffered`` is set.
+        """
+        keys = [
+            key for key in sorted(set(keys))
+            if (buffered or key not in self._buffer) and (key, None, None, None, None, None) not in self._cache and
+            not self._range_deleted(key)
+        ]
+        if not keys:
+            return
+
+        chunk_size = self._db._max_txn_ops
+        chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+
+        async def fetch(chunk):
+            first = await self._begin_read()
+            revision = None
+            self._stats.round_trips += 1
+            try:
+                ops = [
+                    _types.OpGet._create(_types.KeySet._create(key),
+                                         revision=self._revision,
+                                         serializable=self._serializable) for key in chunk
+                ]
+                res = await self._db._client.submit(_types.Transaction._create(success=ops))
+                revision = res.header.revision
+            finally:
+                self._end_read(first, revision)
+            for key, result in zip(chunk, res.responses):
+                self._cache_value(key, result.kvs)
+
+        # the first chunk fixes the snapshot revision (if not yet known), the others then run in parallel
+        await fetch(chunks[0])
+        if len(chunks) > 1:
+            remaining = iter(chunks[1:])
+
+            async def fetch_remaining():
+                for chunk in remaining:
+                    await fetch(chunk)
+
+            parallel = min(concurrency or len(chunks), len(chunks) - 1)
+            await gatherResults([ensureDeferred(fetch_remaining()) for _ in range(parallel)], consumeErrors=True)
+
+        self.log.debug('etcd prefetched {cnt} keys in {chunks} etcd transactions', cnt=len(keys), chunks=len(chunks))
+
+    async def prefetch(self, pmap, keys, concurrency=None):
+        """
+        Read multiple records of a table into the transaction, so that following reads
+        of these records are served locally.
+
+        :param pmap: The table to read from.
+        :type pmap: instance of :class:`txaioetcd._pmap.PersistentMap`
+
+        :param keys: The keys of the records to read.
+        :type keys: iterable
+
+        :param concurrency: Maximum number of etcd transactions reading in parallel.
+        :type concurrency: int or None
+        """
+        assert (self._buffer is not None)
+        assert isinstance(pmap, _pmap.PersistentMap)
+        assert concurrency is None or (type(concurrency) in six.integer_types and concurrency > 0)
+
+        slot = struct.pack('>H', pmap._slot)
+        await self._prefetch([slot + pmap._serialize_key(key) for key in keys], concurrency=concurrency)
+
+    def _update_indexes(self, pmap, _key, key, value):
+        """
+        Update the index entries for a record written (or deleted) in this transaction, before
+        the next read or the commit.
+
+        The index writes are counted in the limits of the transaction, so that an oversized
+        transaction fails on the write exceeding the limits. When the previous value of the record
+        was read, the index writes are known. Otherwise they are estimated from the new index
+        entries of the record (or one delete per index, when the record is deleted).
+        """
+        if _key in self._index_updates:
+            _, _, _, ops, size = self._index_updates[_key]
+            self._index_ops -= ops
+            self._index_size -= size
+
+        changes = None
+        cache_key = (_key, None, None, None, None, None)
+        if cache_key in self._cache:
+            data = None if self._range_deleted(_key) else self._cache[cache_key]
+            try:
+                changes = pmap._index_changes(key, data, value)
+            except _pmap._UnknownCompressionDict:
+                # the dictionaries are loaded when flushing the index updates
+                pass
+
+        if changes:
+            dels, puts = changes
+            ops = len(dels) + len(puts)
+            size = sum(_estimate_size(_ikey, None) for _ikey in dels) + \
+                sum(_estimate_size(_ikey, _data) for _ikey, _data in puts)
+        elif value is None:
+            ops = len(pmap._indexes)
+            size = ops * _estimate_size(b'', None)
+        else:
+            entries = pmap._index_entries(key, value)
+            ops = len(entries)
+            size = sum(_estimate_size(_ikey, _data) for _ikey, _data in entries)
+
+        self._check_size(ops, size)
+
+        self._index_updates[_key] = (pmap, key, value, ops, size)
+        self._index_ops += ops
+        self._index_size += size
+
+    async def _flush_index_updates(self):
+        """
+        Update the index entries of all records written since the last update.
+
+        The previous values of the records are read (from the read cache, or in one batch from
+        etcd), which adds them to the read set: when a record is modified concurrently, the commit
+        fails rather than leaving stale index entries.
+        """
+        updates, self._index_updates = self._index_updates, {}
+        self._index_ops = 0
+        self._index_size = 0
+
+        await self._prefetch(list(updates.keys()), buffered=True)
+
+        dels = []
+        puts = []
+        for _key, (pmap, key, value, _, _) in updates.items():
+            if self._range_deleted(_key):
+                data = None
+            else:
+                data = self._cache[(_key, None, None, None, None, None)]
+            try:
+                _dels, _puts = pmap._index_changes(key, data, value)
+            except _pmap._UnknownCompressionDict:
+                await self._db._reload_compression_dicts(pmap)
+                _dels, _puts = pmap._index_changes(key, data, value)
+            dels.extend(_dels)
+            puts.extend(_puts)
+
+        # deletes first: an index entry deleted for one record might be put for another
+        for _key in dels:
+            self.delete(_key)
+        for _key, data in puts:
+            self.put(_key, data)
+
+    def _buffered(self, key, range_end):
+        """
+        Get the buffered writes within a key range, in key order.
+        """
+        lo = bisect.bisect_left(self._buffer_keys, key)
+        if range_end == b'\0':
+            hi = len(self._buffer_keys)
+        else:
+            hi = bisect.bisect_left(self._buffer_keys, range_end, lo)
+        return [(_key, ) + self._buffer[_key] for _key in self._buffer_keys[lo:hi]]
+
+    def _range_deleted(self, key):
+        """
+        Check whether a key is within a buffered range delete.
+        """
+        for _key, range_end in self._range_dels:
+            if _key <= key and (range_end == b'\0' or key < range_end):
+                return True
+        return False
+
+    def _overlay(self, kvs, buffered, keys_only=None):
+        """
+        Merge buffered writes and range deletes into key-values read from etcd (both in key order).
+        """
+        if self._range_dels:
+            kvs = [kv for kv in kvs if not self._range_deleted(kv.key)]
+
+        result = []
+        i = 0
+        for _key, op, data in buffered:
+            while i < len(kvs) and kvs[i].key < _key:
+                result.append(kvs[i])
+                i += 1
+            if i < len(kvs) and kvs[i].key == _key:
+                i += 1
             if op == DbTransaction.PUT:
-                return data
-            elif op == DbTransaction.DEL:
+                result.append(_types.KeyValue(_key, None if keys_only else data))
+        result.extend(kvs[i:])
+        return result
+
+    async def get(self, key, range_end=None, keys_only=None, count_only=None):
+        """
+        Get a value, or the key-values in a range, including writes buffered in this transaction.
+
+        :param key: The key, or the first key of the range.
+        :type key: bytes
+
+        :param range_end: If given, the (exclusive) end of the range, with ``\\0`` for
+            all keys ``>=`` key.
+        :type range_end: bytes or None
+
+        :param keys_only: For ranges, return key-values with the keys only.
+        :type keys_only: bool or None
+
+        :param count_only: For ranges, return only the number of keys in the range.
+        :type count_only: bool or None
+
+        :returns: The value for a single key, the list of key-values (or ``None``) for a range,
+            or the number of keys in the range.
+        """
+        assert (self._buffer is not None)
+        self._stats.reads += 1
+
+        if self._index_updates:
+            await self._flush_index_updates()
+
+        if range_end is None:
+            if key in self._buffer:
+                self._stats.cache_hits += 1
+                op, data = self._buffer[key]
+                if op == DbTransaction.PUT:
+                    return data
+                elif op == DbTransaction.DEL:
+                    return None
+
+            if self._range_dels and self._range_deleted(key):
                 return None
+
+            return await self._read(key)
+
+        buffered = self._buffered(key, range_end)
+
+        if count_only and not buffered and not self._range_dels:
+            return await self._read(key, range_end, count_only=True)
+
+        # with buffered writes in the range, we need the keys to merge those in
+        kvs = await self._read(key, range_end, keys_only=(keys_only or count_only or None))
+        if buffered or self._range_dels:
+            kvs = self._overlay(kvs, buffered, keys_only)
+
+        if count_only:
+            return len(kvs)
+        elif kvs:
+            # the list of key-values read may be cached
+            return list(kvs)
         else:
-            result = await self._db._client.get(key, range_end=range_end, keys_only=keys_only)
-            if result.kvs:
-                self.log.debug(
-                    'etcd from key {from_key} to {to_key}: loaded {cnt} records',
-                    from_key=key,
-                    to_key=range_end,
-                    cnt=len(result.kvs))
-                if range_end:
-                    return result.kvs
-                else:
-                    return result.kvs[0].value
+            return None
+
+    async def _select_page(self, key, range_end, limit, keys_only=None, reverse=None):
+        """
+        Read a page of the key-values in a range, including writes buffered in this transaction.
+
+        Pages are in key order (or reverse key order), and a page with ``limit`` key-values read
+        from etcd covers the range up to (or down to) the last key read.
+
+        :returns: The key-values of the page, and the range ``(key, range_end)`` of the
+            following pages (or None for the last page).
+        :rtype: tuple
+        """
+        assert (self._buffer is not None)
+        self._stats.reads += 1
+
+        if self._index_updates:
+            await self._flush_index_updates()
+
+        kvs = await self._read(key, range_end, keys_only=keys_only, limit=limit, reverse=reverse)
+        last = limit and len(kvs) >= limit
+
+        if reverse:
+            lo = kvs[-1].key if last else key
+            buffered = self._buffered(lo, range_end)
+            if buffered or self._range_dels:
+                kvs = self._overlay(kvs[::-1], buffered, keys_only)[::-1]
+            remaining = (key, lo) if last else None
+        else:
+            hi = kvs[-1].key + b'\0' if last else range_end
+            buffered = self._buffered(key, hi)
+            if buffered or self._range_dels:
+                kvs = self._overlay(kvs, buffered, keys_only)
+            remaining = (hi, range_end) if last else None
+
+        return kvs, remaining
+
+    def _check_size(self, ops, size):
+        """
+        Check that adding writes keeps the transaction within the limits of one etcd transaction
+        (unless oversized transactions are split).
+
+        :param ops: The number of writes added.
+        :param size: The estimated request size added.
+        """
+        if self._oversize != DbTransaction.OVERSIZE_FAIL:
+            return
+
+        if ops and len(self._buffer) + len(self._range_dels) + self._index_ops + ops > self._db._max_txn_ops:
+            raise Exception('transaction too large: more than {} writes'.format(self._db._max_txn_ops))
+
+        if self._buffer_size + self._index_size + size > self._db._max_request_bytes:
+            raise Exception('transaction too large: more than {} bytes'.format(self._db._max_request_bytes))
+
+    def _buffer_op(self, key, op, data):
+        size = _estimate_size(key, data)
+        if key in self._buffer:
+            size -= _estimate_size(key, self._buffer[key][1])
+            self._check_size(0, size)
+        else:
+            self._check_size(1, size)
+
+        if key not in self._buffer:
+            bisect.insort(self._buffer_keys, key)
+        self._buffer[key] = (op, data)
+        self._buffer_size += size
 
     def put(self, key, data, overwrite=True):
-        assert (self._revision is not None)
+        assert (self._buffer is not None)
 
-        self._buffer[key] = (DbTransaction.PUT, data)
+        self._buffer_op(key, DbTransaction.PUT, data)
 
-        if self._stats:
-            self._stats.puts += 1
+        self._stats.puts += 1
         return True
 
-    def delete(self, key):
-        assert (self._revision is not None)
+    def _delete_range(self, key, range_end):
+        # the range delete supersedes the writes buffered within the range so far
+        lo = bisect.bisect_left(self._buffer_keys, key)
+        if range_end == b'\0':
+            hi = len(self._buffer_keys)
+        else:
+            hi = bisect.bisect_left(self._buffer_keys, range_end, lo)
+        for _key in self._buffer_keys[lo:hi]:
+            self._buffer_size -= _estimate_size(_key, self._buffer.pop(_key)[1])
+        del self._buffer_keys[lo:hi]
+
+        # merge with overlapping range deletes: etcd rejects overlapping operations in one transaction
+        range_dels = []
+        for _key, _range_end in self._range_dels:
+            if (_range_end != b'\0' and _range_end < key) or (range_end != b'\0' and range_end < _key):
+                range_dels.append((_key, _range_end))
+            else:
+                key = min(key, _key)
+                range_end = b'\0' if b'\0' in (range_end, _range_end) else max(range_end, _range_end)
+                self._buffer_size -= _estimate_size(_key, _range_end)
+
+        if self._oversize == DbTransaction.OVERSIZE_FAIL and \
+                len(self._buffer) + len(range_dels) + self._index_ops >= self._db._max_txn_ops:
+            raise Exception('transaction too large: more than {} writes'.format(self._db._max_txn_ops))
 
-        self._buffer[key] = (DbTransaction.DEL, None)
+        range_dels.append((key, range_end))
+        self._range_dels = sorted(range_dels)
+        self._buffer_size += _estimate_size(key, range_end)
+
+    def delete(self, key, range_end=None):
+        """
+        Delete a key, or all keys in a range, when the transaction commits.
 
-        if self._stats:
-            self._stats.dels += 1
+        A range is deleted with a single etcd operation, however many keys are in the range.
+
+        :param key: The key, or the first key of the range.
+        :type key: bytes
+
+        :param range_end: If given, the (exclusive) end of the range, with ``\\0`` for
+            all keys ``>=`` key.
+        :type range_end: bytes or None
+        """
+        assert (self._buffer is not None)
+
+        if range_end is None:
+            self._buffer_op(key, DbTransaction.DEL, None)
+        else:
+            self._delete_range(key, range_end)
+
+        self._stats.dels += 1
         return True
 
 
+class _CommitGroup(object):
+    """
+    Transaction commits merged into one etcd transaction (see ``Database(group_commit=..)``).
+
+    Each commit is a tuple ``(txn, writes, reads, timeout, future)`` with the etcd transaction,
+    the buffered writes and the read set (the guards) of the database transaction.
+    """
+
+    def __init__(self, max_txn_ops, max_request_bytes):
+        self.max_txn_ops = max_txn_ops
+        self.max_request_bytes = max_request_bytes
+        self.commits = []
+        self.writes = set()
+        self.reads = {}
+        self.ops = 0
+        self.size = 0
+
+    def add(self, commit):
+        """
+        Add a commit to the group, if it does not conflict with the commits already in the group
+        and the merged transaction stays within the etcd limits.
+
+        :returns: True, if the commit was added.
+        :rtype: bool
+        """
+        txn, writes, reads = commit[:3]
+
+        size = 0
+        for key, (_, data) in writes.items():
+            size += _estimate_size(key, data)
+
+        if self.commits:
+            if self.ops + len(txn.success) > self.max_txn_ops:
+                return False
+
+            if len(self.reads) + len(reads) > self.max_txn_ops:
+                return False
+
+            if self.size + size > self.max_request_bytes:
+                return False
+
+            # a key may only be written once in an etcd transaction, and must not be written
+            # when another transaction has read it
+            for key in writes:
+                if key in self.writes or key in self.reads:
+                    return False
+
+            for key, mod_revision in reads.items():
+                if key in self.writes or self.reads.get(key, mod_revision) != mod_revision:
+                    return False
+
+        self.commits.append(commit)
+        self.writes.update(writes.keys())
+        self.reads.update(reads)
+        self.ops += len(txn.success)
+        self.size += size
+        return True
+
+    def transaction(self):
+        """
+        Build the merged etcd transaction.
+        """
+        comps = [_types.CompModified._create(key, u'==', mod_revision) for key, mod_revision in self.reads.items()]
+        ops = []
+        for commit in self.commits:
+            ops.extend(commit[0].success)
+        return _types.Transaction._create(compare=comps, success=ops, failure=[])
+
+
 class ConfigurationElement(object):
 
     # oid: uuid.UUID
@@ -303,11 +1150,15 @@ class ConfigurationElement(object):
 
 
 class Slot(ConfigurationElement):
-    def __init__(self, oid=None, name=None, description=None, tags=None, slot=None, creator=None):
+    def __init__(self, oid=None, name=None, description=None, tags=None, slot=None, creator=None,
+                 compression_dicts=None):
         ConfigurationElement.__init__(self, oid=oid, name=name, description=description, tags=tags)
         self._slot = slot
         self._creator = creator
 
+        # zstd compression dictionaries trained for the table (the last one is used for compressing)
+        self._compression_dicts = compression_dicts or []
+
     def __str__(self):
         return pformat(self.marshal())
 
@@ -319,12 +1170,18 @@ class Slot(ConfigurationElement):
     def slot(self):
         return self._slot
 
+    @property
+    def compression_dicts(self):
+        return self._compression_dicts
+
     def marshal(self):
         obj = ConfigurationElement.marshal(self)
         obj.update({
             'creator': self._creator,
             'slot': self._slot,
         })
+        if self._compression_dicts:
+            obj['compression_dicts'] = self._compression_dicts
         return obj
 
     @staticmethod
@@ -335,6 +1192,7 @@ class Slot(ConfigurationElement):
 
         slot = data.get('slot', None)
         creator = data.get('creator', None)
+        compression_dicts = data.get('compression_dicts', None)
 
         drvd_obj = Slot(
             oid=obj.oid,
@@ -342,7 +1200,8 @@ class Slot(ConfigurationElement):
             description=obj.description,
             tags=obj.tags,
             slot=slot,
-            creator=creator)
+            creator=creator,
+            compression_dicts=compression_dicts)
         return drvd_obj
 
 
@@ -358,27 +1217,154 @@ class Database(object):
     """
     log = txaio.make_logger()
 
-    def __init__(self, client, prefix=None, readonly=False):
+    def __init__(self,
+                 client,
+                 prefix=None,
+                 readonly=False,
+                 max_staleness=None,
+                 group_commit=None,
+                 max_txn_ops=None,
+                 max_request_bytes=None,
+                 log_ops=None,
+                 offload_threshold=None):
         """
 
         :param client:
         :param prefix:
         :param readonly:
+        :param max_staleness: If given, transactions may read at an etcd revision seen by the
+            database within this many seconds, instead of the current revision. This saves
+            the round trip to etcd for determining the current revision.
+        :param group_commit: If given, transactions committing within this many seconds are
+            merged into one etcd transaction, as long as they write disjoint keys and do not
+            write keys read by another. This adds up to this delay to every commit.
+        :param max_txn_ops: Maximum number of operations in an etcd transaction
+            (must match the etcd server option ``--max-txn-ops``).
+        :param max_request_bytes: Maximum size of an etcd request in bytes
+            (must match the etcd server option ``--max-request-bytes``).
+        :param log_ops: Fraction of committed transactions (between 0 and 1) for which
+            the individual operations are logged (at log level debug).
+        :param offload_threshold: If given, batches of values of at least this many bytes
+            (eg the records of a page selected) are decompressed and deserialized (or
+            serialized and compressed) in the reactor thread pool, keeping the reactor
+            responsive during large reads and writes.
         """
         assert prefix is None or type(prefix) == six.binary_type
         assert type(readonly) == bool
+        assert max_staleness is None or (type(max_staleness) in six.integer_types + (float, ) and max_staleness >= 0)
+        assert group_commit is None or (type(group_commit) in six.integer_types + (float, ) and group_commit >= 0)
+        assert log_ops is None or (type(log_ops) in six.integer_types + (float, ) and 0 <= log_ops <= 1)
+        assert offload_threshold is None or (type(offload_threshold) in six.integer_types and offload_threshold >= 0)
         self._client = client
         self._prefix = prefix
         self._readonly = readonly
+        self._max_staleness = max_staleness
+        self._log_ops = log_ops
+        self._offload_threshold = offload_threshold
+        self._max_txn_ops = max_txn_ops or _types.MAX_TXN_OPS
+
+        # leave some headroom for the guards and JSON encoding overhead
+        self._max_request_bytes = (max_request_bytes or _types.MAX_REQUEST_BYTES) * 3 // 4
         self._slots = None
         self._slots_by_index = None
 
+        # most recent etcd revision seen in any response, and when it was seen
+        self._revision = None
+        self._revision_seen = None
+
+        # statistics of all transactions run on this database
+        self._stats = DatabaseStats()
+
+        # group commit: commits waiting for the current commit window to close
+        self._group_commit = group_commit
+        self._commits = []
+        self._commits_call = None
+
+    def _observe_revision(self, revision):
+        if self._revision is None or revision >= self._revision:
+            self._revision = revision
+            self._revision_seen = walltime()
+
+    def _submit_grouped(self, txn, writes, reads, timeout=None):
+        """
+        Submit a transaction commit as part of the current commit window.
+
+        :returns: A future that fires with the :class:`txaioetcd.Success` of the commit, or
+            fails with :class:`txaioetcd.Failed`.
+        """
+        future = txaio.create_future()
+        self._commits.append((txn, writes, reads, timeout, future))
+        if self._commits_call is None:
+            self._commits_call = txaio.call_later(self._group_commit, self._flush_commits)
+        return future
+
+    def _flush_commits(self):
+        commits, self._commits, self._commits_call = self._commits, [], None
+
+        groups = []
+        for commit in commits:
+            for group in groups:
+                if group.add(commit):
+                    break
+            else:
+                group = _CommitGroup(self._max_txn_ops, self._max_request_bytes)
+                group.add(commit)
+                groups.append(group)
+
+        self.log.debug('DB group commit: {commits} transactions merged into {groups} etcd transactions',
+                       commits=len(commits),
+                       groups=len(groups))
+
+        for group in groups:
+            if len(group.commits) == 1:
+                ensureDeferred(self._submit_commit(group.commits[0]))
+            else:
+                ensureDeferred(self._submit_group(group))
+
+    async def _submit_commit(self, commit):
+        txn, _, _, timeout, future = commit
+        try:
+            res = await self._client.submit(txn, timeout=timeout)
+        except Exception as e:
+            txaio.reject(future, e)
+        else:
+            txaio.resolve(future, res)
+
+    async def _submit_group(self, group):
+        timeouts = [commit[3] for commit in group.commits if commit[3]]
+        try:
+            res = await self._client.submit(group.transaction(), timeout=(max(timeouts) if timeouts else None))
+        except _types.Failed:
+            # the guards of at least one of the transactions failed: commit the transactions individually,
+            # so only the conflicting ones fail
+            self.log.debug('DB group commit: conflict, falling back to {commits} individual commits',
+                           commits=len(group.commits))
+            for commit in group.commits:
+                ensureDeferred(self._submit_commit(commit))
+        except Exception as e:
+            for commit in group.commits:
+                txaio.reject(commit[4], e)
+        else:
+            # hand out the part of the responses for its own operations to every transaction
+            offset = 0
+            for commit in group.commits:
+                ops = len(commit[0].success)
+                txaio.resolve(commit[4], _types.Success(res.header, res.responses[offset:offset + ops]))
+                offset += ops
+
+    def _recent_revision(self):
+        if self._max_staleness is not None and self._revision is not None:
+            if walltime() - self._revision_seen <= self._max_staleness:
+                return self._revision
+        return None
+
     async def status(self):
         """
 
         :return:
         """
         _status = await self._client.status()
+        self._observe_revision(_status.header.revision)
         return _status.header.revision
 
     async def _cache_slots(self):
@@ -556,26 +1542,238 @@ class Database(object):
         else:
             slot_pmap = klass(slot_index, compress=compress)
 
+        if compress == _pmap.PersistentMap.COMPRESS_ZSTD:
+            for dict_data in self._slots[oid].compression_dicts:
+                slot_pmap._add_compression_dict(dict_data)
+
         return slot_pmap
 
+    async def _reload_compression_dicts(self, pmap):
+        """
+        Load the zstd dictionaries of a table from its slot metadata in etcd, eg when reading
+        values compressed with a dictionary trained by another process.
+        """
+        await self._get_slots(cached=False)
+        for slot in self._slots.values():
+            if slot.slot == pmap.slot:
+                pmap._clear_compression_cache()
+                for dict_data in slot.compression_dicts:
+                    pmap._add_compression_dict(dict_data)
+                self.log.info('Reloaded {count} zstd compression dictionaries for {pmap}',
+                              count=len(slot.compression_dicts),
+                              pmap=pmap)
+
+    async def train_compression_dict(self, pmap, samples=1000, dict_size=16384):
+        """
+        Train a zstd compression dictionary from sample records of a table, and store it in
+        the slot metadata of the table. The table then compresses values with the dictionary,
+        which can improve the compression of small records considerably. Values compressed
+        before (with another or no dictionary) remain readable.
+
+        :param pmap: The table (attached with zstd compression) to train the dictionary for.
+        :type pmap: instance of :class:`txaioetcd._pmap.PersistentMap`
+
+        :param samples: Maximum number of records to train the dictionary from.
+        :type samples: int
+
+        :param dict_size: Maximum size of the dictionary in bytes.
+        :type dict_size: int
+
+        :return: The ID of the dictionary.
+        :rtype: int
+        """
+        assert isinstance(pmap, _pmap.PersistentMap)
+
+        if pmap._compress_mode != _pmap.PersistentMap.COMPRESS_ZSTD:
+            raise Exception('compression dictionaries require zstd compression')
+
+        slots = await self._get_slots()
+        slot = None
+        for _slot in slots.values():
+            if _slot.slot == pmap.slot:
+                slot = _slot
+                break
+        if slot is None:
+            raise Exception('no slot metadata found for table {}'.format(pmap))
+
+        async with self.begin() as txn:
+            values = await pmap.select(txn, limit=samples)
+
+        dict_data = _pmap.zstandard.train_dictionary(dict_size,
+                                                     [pmap._serialize_value(value) for value in values or []])
+        dict_data = dict_data.as_bytes()
+
+        slot.compression_dicts.append(dict_data)
+        await self._set_slot(slot.slot, slot)
+
+        dict_id = pmap._add_compression_dict(dict_data)
+
+        self.log.info('Trained zstd compression dictionary {dict_id} ({size} bytes) for {pmap} from {samples} records',
+                      dict_id=dict_id,
+                      size=len(dict_data),
+                      pmap=pmap,
+                      samples=len(values or []))
+
+        return dict_id
+
     def stats(self):
         """
 
         :return:
         """
-        return self._client._stats.marshal()
+        obj = self._client._stats.marshal()
+        obj['transactions'] = self._stats.marshal()
+        return obj
+
+    @property
+    def transaction_stats(self):
+        """
+        Statistics of all transactions run on this database.
+
+        :rtype: instance of :class:`txaioetcd.DatabaseStats`
+        """
+        return self._stats
 
-    def begin(self, write=False, stats=None, timeout=None):
+    def begin(self, write=False, stats=None, timeout=None, serializable=False, oversize=None, on_progress=None):
         """
 
         :param write:
         :param stats:
         :param timeout:
+        :param serializable:
+        :param oversize:
+        :param on_progress:
         :return:
         """
         if write and self._readonly:
             raise Exception('database is read-only')
 
-        txn = DbTransaction(db=self, write=write, stats=stats, timeout=timeout)
+        txn = DbTransaction(db=self,
+                            write=write,
+                            stats=stats,
+                            timeout=timeout,
+                            serializable=serializable,
+                            oversize=oversize,
+                            on_progress=on_progress)
 
         return txn
+
+    async def run(self, fn, write=True, retries=5, stats=None, timeout=None):
+        """
+        Run a function in a transaction, and re-run it in a new transaction
+        when the commit fails because keys read were modified concurrently.
+
+        The function may run several times, so it must not have side effects
+        other than on the transaction.
+
+        :param fn: Asynchronous function to run, called with the transaction.
+        :type fn: callable
+
+        :param write: Set True for a transaction that should be allowed write access.
+        :type write: bool
+
+        :param retries: Maximum number of times to re-run the function on conflicts.
+        :type retries: int
+
+        :param stats: Transaction statistics tracked.
+        :type stats: etcd.TransactionStats
+
+        :param timeout: Transaction timeout in seconds.
+        :type timeout: int
+
+        :return: The result of the function.
+        """
+        assert callable(fn)
+        assert type(retries) in six.integer_types and retries >= 0
+
+        attempt = 0
+        while True:
+            try:
+                async with self.begin(write=write, stats=stats, timeout=timeout) as txn:
+                    result = await fn(txn)
+            except _types.Failed:
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                self._stats.totals.retries += 1
+                if stats:
+                    stats.retries += 1
+                self.log.info('DB transaction conflict: retrying ({attempt} of {retries})', attempt=attempt,
+                              retries=retries)
+            else:
+                return result
+
+    async def bulk_load(self, pmap, items, concurrency=4, on_progress=None, stats=None, timeout=None):
+        """
+        Load records into a table, eg for the initial population of a table.
+
+        The records are consumed from the iterable as they are written, in write
+        transactions that each fill one etcd transaction, with up to ``concurrency``
+        transactions committing in parallel. Loading is not atomic: when loading
+        fails, the records committed before remain.
+
+        :param pmap: The table to load the records into.
+        :type pmap: instance of :class:`txaioetcd._pmap.PersistentMap`
+
+        :param items: Records to load as ``(key, value)`` pairs.
+        :type items: iterable
+
+        :param concurrency: Maximum number of transactions committing in parallel.
+        :type concurrency: int
+
+        :param on_progress: Called with the number of records loaded after each transaction.
+        :type on_progress: callable or None
+
+        :param stats: Transaction statistics tracked.
+        :type stats: etcd.TransactionStats
+
+        :param timeout: Transaction timeout in seconds.
+        :type timeout: int
+
+        :return: The number of records loaded.
+        :rtype: int
+        """
+        assert isinstance(pmap, _pmap.PersistentMap)
+        assert type(concurrency) in six.integer_types and concurrency > 0
+        assert on_progress is None or callable(on_progress)
+
+        if self._readonly:
+            raise Exception('database is read-only')
+
+        # every record also writes one entry per index
+        chunk_size = max(1, self._max_txn_ops // (1 + len(pmap._indexes)))
+
+        loaded = [0]
+
+        async def load(chunk):
+            async with self.begin(write=True,
+                                  stats=stats,
+                                  timeout=timeout,
+                                  oversize=DbTransaction.OVERSIZE_SPLIT) as txn:
+                await pmap.set_many(txn, chunk)
+            loaded[0] += len(chunk)
+            if on_progress:
+                on_progress(loaded[0])
+
+        loading = []
+        chunk = []
+        try:
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    if len(loading) >= concurrency:
+                        await loading.pop(0)
+                    loading.append(ensureDeferred(load(chunk)))
+                    chunk = []
+            if chunk:
+                loading.append(ensureDeferred(load(chunk)))
+            while loading:
+                await loading.pop(0)
+        except Exception:
+            # wait for the transactions still committing, and raise the first error only
+            await DeferredList(loading, consumeErrors=True)
+            raise
+
+        self.log.info('DB bulk load: {loaded} records loaded into {pmap}', loaded=loaded[0], pmap=pmap)
+
+        return loaded[0]
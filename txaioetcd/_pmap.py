@@ -28,12 +28,23 @@ from __future__ import absolute_import
 
 import struct
 import sys
+import threading
+import uuid
 import zlib
+from collections import deque
 
+import cbor2
 import six
+import txaio
 
 from zlmdb import _types
-from txaioetcd._database import DbTransaction
+from twisted.internet.defer import Deferred, DeferredList, ensureDeferred
+from twisted.internet.threads import deferToThread
+from twisted.python.failure import Failure
+from twisted.web.client import ResponseDone, PotentialDataLoss
+
+from txaioetcd._database import DbTransaction, walltime
+from txaioetcd._types import KeySet, WatchEvent, _increment_last_byte
 
 try:
     import snappy
@@ -42,6 +53,27 @@ except ImportError:
 else:
     HAS_SNAPPY = True
 
+try:
+    import zstandard
+except ImportError:
+    HAS_ZSTD = False
+else:
+    HAS_ZSTD = True
+
+try:
+    import lz4.frame
+except ImportError:
+    HAS_LZ4 = False
+else:
+    HAS_LZ4 = True
+
+try:
+    import numpy
+except ImportError:
+    HAS_NUMPY = False
+else:
+    HAS_NUMPY = True
+
 if sys.version_info < (3, ):
     from UserDict import DictMixin as MutableMapping
     _NATIVE_PICKLE_PROTOCOL = 2
@@ -50,68 +82,495 @@ else:
     _NATIVE_PICKLE_PROTOCOL = 4
 
 
+def _slot_key_part(key):
+    return struct.pack('>H', key)
+
+
+def _uuid_key_part(key):
+    return key.bytes
+
+
+def _string_key_part(key):
+    return key.encode('utf8')
+
+
+class _UnknownCompressionDict(Exception):
+    """
+    A value was compressed with a zstd dictionary not (yet) known, eg trained by another process
+    after the table was attached.
+    """
+
+    def __init__(self, dict_id):
+        Exception.__init__(self, 'zstd compressed value with unknown dictionary {}'.format(dict_id))
+        self.dict_id = dict_id
+
+
+# etcd keys of OID keyed records: the slot followed by the OID
+_OID_KEYS_DTYPE = [('slot', '>u2'), ('oid', '>u8')]
+
+
+def _uuids(ints):
+    """
+    Create UUIDs from 128 bit integers, bypassing the argument parsing of ``uuid.UUID()``
+    (which takes most of the time when creating many UUIDs).
+    """
+    if not hasattr(uuid, 'SafeUUID'):
+        return [uuid.UUID(int=value) for value in ints]
+
+    new, setattr_ = object.__new__, object.__setattr__
+    is_safe = uuid.SafeUUID.unknown
+    uuids = []
+    for value in ints:
+        _uuid = new(uuid.UUID)
+        setattr_(_uuid, 'int', value)
+        setattr_(_uuid, 'is_safe', is_safe)
+        uuids.append(_uuid)
+    return uuids
+
+
 class PersistentMapIterator(object):
-    def __init__(self, txn, pmap, from_key=None, to_key=None, return_keys=True, return_values=True):
+    """
+    Iterator over (a range of) the records in a persistent map.
+
+    Records are read from etcd in pages, with the next page being read while the records
+    of the current page are consumed. Iterate asynchronously:
+
+    .. code-block:: python
+
+        async for key, value in PersistentMapIterator(txn, pmap):
+            print(key, value)
+
+    or await the iterator to get all records as lists at once.
+    """
+
+    PAGE_SIZE = 1000
+    """
+    Default number of records read from etcd per page.
+    """
+
+    def __init__(self,
+                 txn,
+                 pmap,
+                 from_key=None,
+                 to_key=None,
+                 return_keys=True,
+                 return_values=True,
+                 limit=None,
+                 reverse=False,
+                 page_size=None,
+                 prefix=None):
+        """
+
+        :param txn: The transaction to read in.
+        :param pmap: The persistent map to read from.
+        :param from_key: Start of the range (inclusive).
+        :param to_key: End of the range (exclusive).
+        :param return_keys: Return the keys of the records.
+        :param return_values: Return the values of the records. When only keys are
+            returned, no values are transferred from etcd.
+        :param limit: Maximum number of records to return.
+        :param reverse: Iterate in reverse key order (from the end of the range).
+        :param page_size: Number of records read from etcd per page.
+        :param prefix: Key prefix of the records (instead of a range), see
+            :meth:`PersistentMap.select`.
+        """
+        assert return_keys or return_values
+        assert limit is None or (type(limit) in six.integer_types and limit > 0)
+        assert page_size is None or (type(page_size) in six.integer_types and page_size > 0)
+
         self._txn = txn
         self._pmap = pmap
 
-        self._from_key = struct.pack('>H', pmap._slot)
-        if from_key:
-            self._from_key += pmap._serialize_key(from_key)
-
-        if to_key:
-            self._to_key = struct.pack('>H', pmap._slot) + pmap._serialize_key(to_key)
-        else:
-            self._to_key = struct.pack('>H', pmap._slot + 1)
+        self._from_key, self._to_key = pmap._key_range(from_key, to_key, prefix)
 
         self._return_keys = return_keys
         self._return_values = return_values
+        self._keys_only = None if return_values else True
+        self._limit = limit
+        self._reverse = reverse or None
+        self._page_size = page_size or PersistentMapIterator.PAGE_SIZE
 
-        self._cursor = None
-        self._found = None
+        # records of the current page not yet returned, number of records read so far
+        self._page = None
+        self._read = 0
 
-    def __iter__(self):
-        self._cursor = self._txn._txn.cursor()
-        self._found = self._cursor.set_range(self._from_key)
-        return self
+        # the read of the next page (or None, when on the last page)
+        self._next_page = None
+
+    def _read_page(self, key_range):
+        return ensureDeferred(self._page_records(key_range))
 
-    def __next__(self):
-        if not self._found:
-            raise StopIteration
+    async def _page_records(self, key_range):
+        key, range_end = key_range
+        limit = self._page_size
+        if self._limit:
+            limit = min(limit, self._limit - self._read)
 
-        _key = self._cursor.key()
-        if _key >= self._to_key:
-            raise StopIteration
+        kvs, remaining = await self._txn._select_page(key,
+                                                      range_end,
+                                                      limit,
+                                                      keys_only=self._keys_only,
+                                                      reverse=self._reverse)
 
-        _key = self._pmap._deserialize_key(_key[2:])
+        # writes buffered in the transaction might add to the page
+        if self._limit:
+            kvs = kvs[:self._limit - self._read]
+        self._read += len(kvs)
 
+        return await self._decode(kvs), remaining
+
+    async def _decode(self, kvs):
         if self._return_values:
-            _data = self._cursor.value()
-            if _data:
-                if self._pmap._decompress:
-                    _data = self._pmap._decompress(_data)
-                _data = self._pmap._deserialize_value(_data)
-        else:
-            _data = None
+            values = await self._pmap._decode_many(self._txn, [kv.value for kv in kvs])
 
-        self._found = self._cursor.next()
+        if self._return_keys:
+            keys = self._pmap._deserialize_keys([kv.key for kv in kvs])
 
         if self._return_keys and self._return_values:
-            return _key, _data
+            return list(zip(keys, values))
         elif self._return_values:
-            return _data
+            return values
+        else:
+            return keys
+
+    async def _stop(self):
+        """
+        Stop iterating, waiting for the read of the next page (if any) to finish.
+        """
+        if self._next_page is not None:
+            next_page, self._next_page = self._next_page, None
+            await DeferredList([next_page], consumeErrors=True)
+        self._page = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._page is None:
+            self._page = []
+            self._next_page = self._read_page((self._from_key, self._to_key))
+
+        while not self._page:
+            if self._next_page is None:
+                raise StopAsyncIteration
+
+            records, remaining = await self._next_page
+
+            # read the next page while the records of this page are consumed
+            if remaining and not (self._limit and self._read >= self._limit):
+                self._next_page = self._read_page(remaining)
+            else:
+                self._next_page = None
+
+            self._page = records
+            self._page.reverse()
+
+        return self._page.pop()
+
+    async def _collect(self):
+        res_keys, res_values = None, None
+        async for record in self:
+            if res_keys is None:
+                res_keys, res_values = [], []
+            if self._return_keys and self._return_values:
+                res_keys.append(record[0])
+                res_values.append(record[1])
+            elif self._return_keys:
+                res_keys.append(record)
+            else:
+                res_values.append(record)
+
+        if self._return_keys and self._return_values:
+            return res_keys, res_values
         elif self._return_keys:
-            return _key
+            return res_keys
         else:
-            return None
+            return res_values
+
+    def __await__(self):
+        return self._collect().__await__()
+
+
+class PersistentMapIndexIterator(PersistentMapIterator):
+    """
+    Iterator over the records in a persistent map referenced by (a range of) an index,
+    in index order.
+
+    The index is read in pages, and the records referenced by each page are read in
+    batches of etcd transactions of get operations.
+    """
 
-    next = __next__  # Python 2
+    def __init__(self,
+                 txn,
+                 pmap,
+                 index,
+                 from_key=None,
+                 to_key=None,
+                 return_keys=False,
+                 return_values=True,
+                 limit=None,
+                 reverse=False,
+                 page_size=None,
+                 concurrency=None,
+                 projected=False,
+                 prefix=None):
+        """
+
+        :param txn: The transaction to read in.
+        :param pmap: The persistent map to read from.
+        :param index: The index on the persistent map to read by.
+        :param from_key: Start of the index range (inclusive).
+        :param to_key: End of the index range (exclusive).
+        :param return_keys: Return the (primary) keys of the records.
+        :param return_values: Return the values of the records. When only keys are
+            returned, only the index is read.
+        :param limit: Maximum number of records to return.
+        :param reverse: Iterate in reverse index order (from the end of the range).
+        :param page_size: Number of index records read from etcd per page.
+        :param concurrency: Maximum number of etcd transactions reading records
+            of a page in parallel.
+        :param projected: Return the projections of the records stored in the (covering)
+            index instead of the values, so that only the index is read.
+        :param prefix: Prefix of the index keys (instead of a range).
+        """
+        PersistentMapIterator.__init__(self,
+                                       txn,
+                                       index.pmap,
+                                       from_key=from_key,
+                                       to_key=to_key,
+                                       return_keys=return_keys,
+                                       return_values=return_values,
+                                       limit=limit,
+                                       reverse=reverse,
+                                       page_size=page_size,
+                                       prefix=prefix)
+        self._table = pmap
+        self._index = index
+        self._concurrency = concurrency
+        self._projected = projected
+
+        # the primary keys are stored in the values of the index records
+        self._keys_only = None
+
+    async def _decode(self, kvs):
+        entries = [self._index._parse_value(kv.value) for kv in kvs]
+        keys = [key for key, _ in entries]
+
+        if not self._return_values:
+            return keys
+
+        if self._projected:
+            if self._return_keys:
+                return entries
+            else:
+                return [projection for _, projection in entries]
+
+        await self._txn.prefetch(self._table, keys, concurrency=self._concurrency)
+
+        found = []
+        datas = []
+        for key in keys:
+            _data = await self._txn.get(struct.pack('>H', self._table._slot) + self._table._serialize_key(key))
+            if _data:
+                found.append(key)
+                datas.append(_data)
+            # else: record deleted in this transaction
+        values = await self._table._decode_many(self._txn, datas)
+
+        if self._return_keys:
+            return list(zip(found, values))
+        else:
+            return values
+
+
+class PersistentMapChanges(object):
+    """
+    Change feed of (a range of) the records in a persistent map, iterated asynchronously:
+
+    .. code-block:: python
+
+        async for op, key, new_value, old_value, revision in users_table.changes(db):
+            print(op, key, new_value, old_value, revision)
+
+    The changes are received from one etcd watch over the keys of the map, which is restarted
+    from the revision following the last change received when the watch ends (eg when the
+    connection to etcd is lost). The changes received while the previous changes are consumed
+    are decoded in one batch.
+    """
+
+    RETRY_DELAY = 1.
+    """
+    Seconds to wait before restarting the watch.
+    """
+
+    log = txaio.make_logger()
+
+    def __init__(self, db, pmap, from_revision=None, from_key=None, to_key=None, prefix=None):
+        """
+
+        :param db: The database to watch.
+        :param pmap: The persistent map to watch.
+        :param from_revision: The etcd revision to receive changes from (inclusive), eg the
+            revision following the last change processed before. When not given, changes
+            following the current revision are received.
+        :param from_key: Start of the range (inclusive).
+        :param to_key: End of the range (exclusive).
+        :param prefix: Key prefix of the records (instead of a range), see
+            :meth:`PersistentMap.select`.
+        """
+        assert from_revision is None or (type(from_revision) in six.integer_types and from_revision > 0)
+
+        self._db = db
+        self._pmap = pmap
+        self._key, self._range_end = pmap._key_range(from_key, to_key, prefix)
+
+        # the revision to (re)start watching from
+        self._revision = from_revision
+
+        # events received but not yet decoded, and changes not yet returned
+        self._events = []
+        self._changes = deque()
+
+        # the etcd watch, and the deferred the iterator waits on for events
+        self._watching = None
+        self._waiting = None
+
+        self._started = False
+        self._closed = False
+        self._error = None
+
+    @property
+    def revision(self):
+        """
+        The revision the change feed would be resumed from.
+        """
+        return self._revision
+
+    def _watch(self):
+        if self._closed:
+            return
+        self._watching = self._db._client.watch([KeySet._create(self._key, range_end=self._range_end)],
+                                                self._on_response,
+                                                start_revision=self._revision,
+                                                return_previous=True,
+                                                return_events=True)
+        self._watching.addBoth(self._on_watch_ended)
+
+    def _on_response(self, response):
+        if self._closed:
+            return
+
+        if response.canceled:
+            if response.compact_revision:
+                self._fail(
+                    Exception('changes from revision {} not available, compacted up to revision {}'.format(
+                        self._revision, response.compact_revision)))
+            else:
+                self._fail(Exception('etcd watch canceled'))
+        elif response.events:
+            self._revision = response.events[-1].kv.mod_revision + 1
+            self._events.extend(response.events)
+            self._wake()
+        elif response.header and (self._revision is None or not response.created):
+            # a watch created without a revision starts following the revision of the response,
+            # and progress notifications tell that all events up to their revision were received
+            self._revision = max(self._revision or 0, response.header.revision + 1)
+
+    def _on_watch_ended(self, result):
+        self._watching = None
+        if self._closed or self._error:
+            return
+        # the stream ending (e.g. on a server side timeout) is not an error
+        if isinstance(result, Failure) and not result.check(ResponseDone, PotentialDataLoss):
+            self.log.warn('etcd watch on {pmap} failed: {error}', pmap=self._pmap, error=result.value)
+        self.log.info('restarting etcd watch on {pmap} from revision {revision}',
+                      pmap=self._pmap,
+                      revision=self._revision)
+        txaio.call_later(self.RETRY_DELAY, self._watch)
+
+    def _wake(self):
+        if self._waiting:
+            waiting, self._waiting = self._waiting, None
+            waiting.callback(None)
+
+    def _fail(self, error):
+        self._error = error
+        if self._watching:
+            self._watching.cancel()
+        self._wake()
+
+    def close(self):
+        """
+        Stop watching. Changes already received are still returned.
+        """
+        self._closed = True
+        if self._watching:
+            self._watching.cancel()
+        self._wake()
+
+    async def _decode(self, events):
+        pmap = self._pmap
+        keys = pmap._deserialize_keys([evt.kv.key for evt in events])
+
+        datas = []
+        for evt in events:
+            if evt.type == WatchEvent.PUT and evt.kv.value:
+                datas.append(evt.kv.value)
+            if evt.prev_kv and evt.prev_kv.value:
+                datas.append(evt.prev_kv.value)
+
+        values, _, _, _ = await pmap._decode_batch(self._db, datas)
+        values = iter(values)
+
+        changes = []
+        for key, evt in zip(keys, events):
+            new_value = next(values) if evt.type == WatchEvent.PUT and evt.kv.value else None
+            old_value = next(values) if evt.prev_kv and evt.prev_kv.value else None
+            changes.append((evt.type, key, new_value, old_value, evt.kv.mod_revision))
+        return changes
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._started:
+            self._started = True
+            self._watch()
+
+        while not self._changes:
+            if self._events:
+                events, self._events = self._events, []
+                self._changes.extend(await self._decode(events))
+            elif self._error:
+                raise self._error
+            elif self._closed:
+                raise StopAsyncIteration
+            else:
+                self._waiting = Deferred()
+                await self._waiting
+
+        return self._changes.popleft()
 
 
 class Index(object):
-    def __init__(self, fkey, pmap):
+    """
+    Secondary index on a persistent map (the indexed table), stored in another
+    persistent map (the index table) that maps index keys to primary keys.
+
+    Entries of unique indexes are stored under the index key. Entries of non-unique
+    indexes are stored under the index key, followed by a null byte and the primary key,
+    so that all primary keys for an index key are found with a prefix scan.
+
+    Covering indexes (with a projection) store the primary key and the projection of
+    the record, CBOR encoded, in the values of the index entries.
+    """
+
+    def __init__(self, fkey, pmap, unique=True, multi=False, projection=None):
         self._fkey = fkey
         self._pmap = pmap
+        self._unique = unique
+        self._multi = multi
+        self._projection = projection
 
     @property
     def fkey(self):
@@ -121,6 +580,87 @@ class Index(object):
     def pmap(self):
         return self._pmap
 
+    @property
+    def unique(self):
+        return self._unique
+
+    @property
+    def multi(self):
+        return self._multi
+
+    @property
+    def projection(self):
+        return self._projection
+
+    def _index_prefix(self, fkey):
+        return struct.pack('>H', self._pmap._slot) + self._pmap._serialize_key(fkey)
+
+    def _index_entries(self, pkey, key, value):
+        """
+        Get the index entries for a record.
+
+        :param pkey: The primary key of the record (serialized).
+        :param key: The primary key of the record.
+        :param value: The value of the record (or None).
+        :returns: Map of the keys to the values of the index entries.
+        :rtype: dict
+        """
+        if value is None:
+            return {}
+
+        if self._multi:
+            fkeys = self._fkey(value) or []
+        else:
+            fkeys = [self._fkey(value)]
+
+        _data = self._pmap._serialize_value(key)
+        if self._projection:
+            _data = cbor2.dumps([_data, self._projection(value)])
+
+        entries = {}
+        for fkey in fkeys:
+            if fkey is None:
+                continue
+            _key = self._index_prefix(fkey)
+            if not self._unique:
+                _key += b'\x00' + pkey
+            entries[_key] = _data
+        return entries
+
+    def _parse_value(self, data):
+        """
+        Parse the value of an index entry.
+
+        :returns: The primary key and the projection (or None) of the record.
+        :rtype: tuple
+        """
+        if self._projection:
+            _data, projection = cbor2.loads(data)
+        else:
+            _data, projection = data, None
+        return self._pmap._deserialize_value(_data), projection
+
+    async def lookup(self, txn, fkey):
+        """
+        Look up the primary keys of the records with an index key.
+
+        :param txn: The transaction to read in.
+        :param fkey: The index key to look up.
+        :return: The primary keys of the records (in index order).
+        :rtype: list
+        """
+        _key = self._index_prefix(fkey)
+
+        if self._unique:
+            _data = await txn.get(_key)
+            if _data:
+                return [self._parse_value(_data)[0]]
+            else:
+                return []
+        else:
+            kvs = await txn.get(_key + b'\x00', range_end=_key + b'\x01')
+            return [self._parse_value(kv.value)[0] for kv in kvs or []]
+
 
 class PersistentMap(MutableMapping):
     """
@@ -128,37 +668,170 @@ class PersistentMap(MutableMapping):
     """
     COMPRESS_ZLIB = 1
     COMPRESS_SNAPPY = 2
+    COMPRESS_ZSTD = 3
+    COMPRESS_LZ4 = 4
+
+    COMPRESS_MIN_SIZE = 64
+    """
+    With compression, values (serialized) smaller than this many bytes are stored uncompressed.
+    """
+
+    KEY_PARTS = None
+    """
+    For composite keys: the functions serializing the parts of a key, for prefix queries.
+    """
+
+    log = txaio.make_logger()
+
+    _COMPRESS_NONE = 0
 
     def __init__(self, slot, compress=None):
         """
 
+        With compression, values are stored prefixed with a one-byte codec tag (one of the
+        ``COMPRESS_*`` modes, or 0 for values stored uncompressed), so that values remain
+        readable after changing the compression mode of a table.
+
         :param slot:
-        :param compress:
+        :param compress: Compression mode, one of ``COMPRESS_ZLIB``, ``COMPRESS_SNAPPY``,
+            ``COMPRESS_ZSTD`` (requires zstandard) or ``COMPRESS_LZ4`` (requires lz4).
         """
         assert slot is None or type(slot) in six.integer_types
-        assert compress is None or compress in [PersistentMap.COMPRESS_ZLIB, PersistentMap.COMPRESS_SNAPPY]
+        assert compress is None or compress in [
+            PersistentMap.COMPRESS_ZLIB, PersistentMap.COMPRESS_SNAPPY, PersistentMap.COMPRESS_ZSTD,
+            PersistentMap.COMPRESS_LZ4
+        ]
 
         self._slot = slot
+        self._compress_mode = compress
+
+        # zstd dictionaries by dictionary ID, and the dictionary to compress with
+        self._zstd_dicts = {}
+        self._zstd_dict = None
+
+        # zstd (de)compressors by dictionary ID, per thread, as these are not thread-safe
+        # and values might be (de)compressed in worker threads
+        self._zstd_cache = threading.local()
 
         if compress:
-            if compress not in [PersistentMap.COMPRESS_ZLIB, PersistentMap.COMPRESS_SNAPPY]:
+            if compress not in [
+                    PersistentMap.COMPRESS_ZLIB, PersistentMap.COMPRESS_SNAPPY, PersistentMap.COMPRESS_ZSTD,
+                    PersistentMap.COMPRESS_LZ4
+            ]:
                 raise Exception('invalid compression mode')
             if compress == PersistentMap.COMPRESS_SNAPPY and not HAS_SNAPPY:
                 raise Exception('snappy compression requested, but snappy is not installed')
-            if compress == PersistentMap.COMPRESS_ZLIB:
-                self._compress = zlib.compress
-                self._decompress = zlib.decompress
-            elif compress == PersistentMap.COMPRESS_SNAPPY:
-                self._compress = snappy.compress
-                self._decompress = snappy.uncompress
-            else:
-                raise Exception('logic error')
+            if compress == PersistentMap.COMPRESS_ZSTD and not HAS_ZSTD:
+                raise Exception('zstd compression requested, but zstandard is not installed')
+            if compress == PersistentMap.COMPRESS_LZ4 and not HAS_LZ4:
+                raise Exception('lz4 compression requested, but lz4 is not installed')
+            self._compress = self._compress_tagged
+            self._decompress = self._decompress_tagged
         else:
             self._compress = lambda data: data
             self._decompress = lambda data: data
 
         self._indexes = set()
 
+    def _add_compression_dict(self, dict_data):
+        """
+        Add a zstd dictionary (eg trained from sample values of this table), and use it
+        for compressing from now on.
+
+        :returns: The ID of the dictionary.
+        :rtype: int
+        """
+        if not HAS_ZSTD:
+            raise Exception('zstd dictionary given, but zstandard is not installed')
+        zstd_dict = zstandard.ZstdCompressionDict(dict_data)
+        self._zstd_dicts[zstd_dict.dict_id()] = zstd_dict
+        self._zstd_dict = zstd_dict
+        return zstd_dict.dict_id()
+
+    def _clear_compression_cache(self):
+        """
+        Drop the cached zstd (de)compressors of all threads, eg after reloading the dictionaries.
+        """
+        self._zstd_cache = threading.local()
+
+    def _zstd_compressor(self):
+        cache = self._zstd_cache
+        if not hasattr(cache, 'compressors'):
+            cache.compressors = {}
+        dict_id = self._zstd_dict.dict_id() if self._zstd_dict else 0
+        if dict_id not in cache.compressors:
+            cache.compressors[dict_id] = zstandard.ZstdCompressor(dict_data=self._zstd_dict)
+        return cache.compressors[dict_id]
+
+    def _zstd_decompressor(self, dict_id):
+        cache = self._zstd_cache
+        if not hasattr(cache, 'decompressors'):
+            cache.decompressors = {}
+        if dict_id not in cache.decompressors:
+            cache.decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=self._zstd_dicts.get(dict_id))
+        return cache.decompressors[dict_id]
+
+    def _compress_with(self, mode, data):
+        if mode == PersistentMap.COMPRESS_ZLIB:
+            return zlib.compress(data)
+        elif mode == PersistentMap.COMPRESS_SNAPPY:
+            return snappy.compress(data)
+        elif mode == PersistentMap.COMPRESS_ZSTD:
+            return self._zstd_compressor().compress(data)
+        elif mode == PersistentMap.COMPRESS_LZ4:
+            return lz4.frame.compress(data)
+        else:
+            raise Exception('logic error')
+
+    def _decompress_with(self, mode, data):
+        if mode == PersistentMap.COMPRESS_ZLIB:
+            return zlib.decompress(data)
+        elif mode == PersistentMap.COMPRESS_SNAPPY:
+            if not HAS_SNAPPY:
+                raise Exception('snappy compressed value, but snappy is not installed')
+            return snappy.uncompress(data)
+        elif mode == PersistentMap.COMPRESS_ZSTD:
+            if not HAS_ZSTD:
+                raise Exception('zstd compressed value, but zstandard is not installed')
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            if dict_id and dict_id not in self._zstd_dicts:
+                raise _UnknownCompressionDict(dict_id)
+            return self._zstd_decompressor(dict_id).decompress(data)
+        elif mode == PersistentMap.COMPRESS_LZ4:
+            if not HAS_LZ4:
+                raise Exception('lz4 compressed value, but lz4 is not installed')
+            return lz4.frame.decompress(data)
+        else:
+            raise Exception('logic error')
+
+    def _compress_tagged(self, data):
+        if len(data) >= self.COMPRESS_MIN_SIZE:
+            compressed = self._compress_with(self._compress_mode, data)
+
+            # store values that do not shrink uncompressed
+            if len(compressed) < len(data):
+                return struct.pack('B', self._compress_mode) + compressed
+
+        return struct.pack('B', PersistentMap._COMPRESS_NONE) + data
+
+    def _decompress_tagged(self, data):
+        tag = six.indexbytes(data, 0)
+        if self._compress_mode == PersistentMap.COMPRESS_SNAPPY and 0 < tag <= 4 and len(data) == tag + 2 and \
+                six.indexbytes(data, 1) == (tag - 1) << 2:
+            # value stored before codec tags were introduced, of 1 to 4 bytes: snappy data starts with
+            # the length, followed by a literal of that length (and tagged compressed data does not match)
+            return self._decompress_with(self._compress_mode, data)
+        elif tag == PersistentMap._COMPRESS_NONE:
+            return data[1:]
+        elif tag in (PersistentMap.COMPRESS_ZLIB, PersistentMap.COMPRESS_SNAPPY, PersistentMap.COMPRESS_ZSTD,
+                     PersistentMap.COMPRESS_LZ4):
+            return self._decompress_with(tag, data[1:])
+        elif self._compress_mode in (PersistentMap.COMPRESS_ZLIB, PersistentMap.COMPRESS_SNAPPY):
+            # value stored before codec tags were introduced (zlib data starts with 0x78)
+            return self._decompress_with(self._compress_mode, data)
+        else:
+            raise Exception('invalid codec tag {}'.format(tag))
+
     def __str__(self):
         return '{}(slot={})'.format(self.__class__, self._slot)
 
@@ -166,17 +839,28 @@ class PersistentMap(MutableMapping):
     def slot(self):
         return self._slot
 
-    def attach_index(self, pmap, fkey):
+    def attach_index(self, pmap, fkey, unique=True, multi=False, projection=None):
         """
 
-        :param pmap:
-        :param fkey:
+        :param pmap: The index table, with the index keys as keys and the primary keys
+            of this table as values.
+        :param fkey: Function computing the index key from a record (or None to not
+            index the record).
+        :param unique: Set False for indexes where records may have the same index key.
+        :param multi: Set True if ``fkey`` returns a list of index keys per record,
+            eg for indexing records by tags.
+        :param projection: Function computing a projection of a record (eg a few fields)
+            to store in the index, returning a CBOR serializable object. The projections
+            can then be selected from the index without reading the records.
         :return:
         """
         assert isinstance(pmap, PersistentMap)
         assert callable(fkey)
+        assert type(unique) == bool
+        assert type(multi) == bool
+        assert projection is None or callable(projection)
 
-        index = Index(fkey, pmap)
+        index = Index(fkey, pmap, unique=unique, multi=multi, projection=projection)
         self._indexes.add(index)
 
         return index
@@ -198,15 +882,148 @@ class PersistentMap(MutableMapping):
     def _serialize_key(self, key):
         raise Exception('must be implemented in derived class')
 
+    def _serialize_key_prefix(self, prefix):
+        """
+        Serialize a key prefix: for composite keys a tuple of the leading parts of a key,
+        and otherwise a key (eg a string prefix of string keys).
+        """
+        if type(prefix) == tuple:
+            if not self.KEY_PARTS or len(prefix) > len(self.KEY_PARTS):
+                raise Exception('invalid key prefix {} for {}'.format(prefix, self))
+            return b''.join(serialize(part) for serialize, part in zip(self.KEY_PARTS, prefix))
+        else:
+            return self._serialize_key(prefix)
+
+    def _key_range(self, from_key=None, to_key=None, prefix=None):
+        """
+        Compute the (etcd) key range of the records in a key range, or with a key prefix.
+
+        :returns: The first key and the range end.
+        :rtype: tuple
+        """
+        slot = struct.pack('>H', self._slot)
+
+        if prefix is not None:
+            assert from_key is None and to_key is None
+            key = slot + self._serialize_key_prefix(prefix)
+            return key, _increment_last_byte(key)
+
+        key = slot
+        if from_key:
+            key += self._serialize_key(from_key)
+
+        if to_key:
+            range_end = slot + self._serialize_key(to_key)
+        else:
+            range_end = _increment_last_byte(slot)
+
+        return key, range_end
+
     def _deserialize_key(self, data):
         raise Exception('must be implemented in derived class')
 
+    def _deserialize_keys(self, _keys):
+        """
+        Deserialize the keys of a batch of records from their etcd keys (including the slot).
+        """
+        return [self._deserialize_key(_key[2:]) for _key in _keys]
+
     def _serialize_value(self, value):
         raise Exception('must be implemented in derived class')
 
     def _deserialize_value(self, data):
         raise Exception('must be implemented in derived class')
 
+    def _decode_values(self, datas):
+        """
+        Decompress and deserialize values (this may run in a worker thread).
+
+        :returns: The values, and the times spent decompressing and deserializing.
+        :rtype: tuple
+        """
+        decompress_time = 0
+        started = walltime()
+        values = []
+        for _data in datas:
+            decompress_started = walltime()
+            _data = self._decompress(_data)
+            decompress_time += walltime() - decompress_started
+            values.append(self._deserialize_value(_data))
+        return values, decompress_time, walltime() - started - decompress_time
+
+    def _encode_values(self, values):
+        """
+        Serialize and compress values (this may run in a worker thread).
+
+        :returns: The data, and the times spent serializing and compressing.
+        :rtype: tuple
+        """
+        compress_time = 0
+        started = walltime()
+        datas = []
+        for value in values:
+            _data = self._serialize_value(value)
+            compress_started = walltime()
+            datas.append(self._compress(_data))
+            compress_time += walltime() - compress_started
+        return datas, walltime() - started - compress_time, compress_time
+
+    async def _decode_batch(self, db, datas, reload_dicts=True):
+        """
+        Decompress and deserialize a batch of values, in a worker thread when the batch
+        is at least of the offload threshold of the database. Values compressed with zstd
+        dictionaries not yet known are decoded after loading the dictionaries from etcd.
+
+        :returns: The values, the times spent decompressing and deserializing, and whether
+            the batch was decoded in a worker thread.
+        :rtype: tuple
+        """
+        threshold = db._offload_threshold
+        offload = threshold is not None and datas and sum(len(_data) for _data in datas) >= threshold
+        try:
+            if offload:
+                values, decompress_time, deserialize_time = await deferToThread(self._decode_values, datas)
+            else:
+                values, decompress_time, deserialize_time = self._decode_values(datas)
+        except _UnknownCompressionDict:
+            if not reload_dicts:
+                raise
+            await db._reload_compression_dicts(self)
+            return await self._decode_batch(db, datas, reload_dicts=False)
+        return values, decompress_time, deserialize_time, offload
+
+    async def _decode_many(self, txn, datas):
+        """
+        Decompress and deserialize a batch of values (see :meth:`_decode_batch`).
+        """
+        values, decompress_time, deserialize_time, offloaded = await self._decode_batch(txn._db, datas)
+        if offloaded:
+            txn._stats.offloads += 1
+        txn._stats.decompress_time += decompress_time
+        txn._stats.deserialize_time += deserialize_time
+        return values
+
+    async def _encode_many(self, txn, values):
+        """
+        Serialize and compress a batch of values, in a worker thread when the batch is
+        estimated to be at least of the offload threshold of the database.
+        """
+        if not values:
+            return []
+
+        # the size of the batch is estimated from the first value
+        datas, serialize_time, compress_time = self._encode_values(values[:1])
+
+        threshold = txn._db._offload_threshold
+        if threshold is not None and len(datas[0]) * len(values) >= threshold:
+            _datas, _serialize_time, _compress_time = await deferToThread(self._encode_values, values[1:])
+            txn._stats.offloads += 1
+        else:
+            _datas, _serialize_time, _compress_time = self._encode_values(values[1:])
+        txn._stats.serialize_time += serialize_time + _serialize_time
+        txn._stats.compress_time += compress_time + _compress_time
+        return datas + _datas
+
     async def __getitem__(self, txn_key):
         """
 
@@ -220,12 +1037,33 @@ class PersistentMap(MutableMapping):
         _data = await txn.get(_key)
 
         if _data:
-            if self._decompress:
-                _data = self._decompress(_data)
-            return self._deserialize_value(_data)
+            values = await self._decode_many(txn, [_data])
+            return values[0]
         else:
             return None
 
+    async def get_many(self, txn, keys):
+        """
+        Get multiple records, reading all records from etcd in as few round trips as possible.
+
+        :param txn: The transaction to read in.
+        :type txn: instance of :class:`txaioetcd.DbTransaction`
+
+        :param keys: The keys of the records to get.
+        :type keys: list
+
+        :return: The records (or None for keys not existing), in the order of the keys.
+        :rtype: list
+        """
+        await txn.prefetch(self, keys)
+
+        datas = []
+        for key in keys:
+            datas.append(await txn.get(struct.pack('>H', self._slot) + self._serialize_key(key)))
+
+        values = iter(await self._decode_many(txn, [_data for _data in datas if _data]))
+        return [next(values) if _data else None for _data in datas]
+
     def __setitem__(self, txn_key, value):
         """
 
@@ -240,39 +1078,83 @@ class PersistentMap(MutableMapping):
         assert isinstance(txn, DbTransaction)
         assert key
 
+        datas, serialize_time, compress_time = self._encode_values([value])
+        txn._stats.serialize_time += serialize_time
+        txn._stats.compress_time += compress_time
+
+        self._put(txn, key, value, datas[0])
+
+    def _put(self, txn, key, value, data):
         _key = struct.pack('>H', self._slot) + self._serialize_key(key)
-        _data = self._serialize_value(value)
 
-        if self._compress:
-            _data = self._compress(_data)
+        txn.put(_key, data)
 
-        txn.put(_key, _data)
+        if self._indexes:
+            txn._update_indexes(self, _key, key, value)
 
-        for index in self._indexes:
-            # FIXME: remove index entries for previous value
+    async def set_many(self, txn, items):
+        """
+        Set multiple records. Unlike setting records one by one, large batches of values are
+        serialized and compressed in a worker thread (see ``Database(offload_threshold=..)``).
+
+        :param txn: The (write) transaction to write in.
+        :type txn: instance of :class:`txaioetcd.DbTransaction`
+
+        :param items: The records to set as ``(key, value)`` pairs.
+        :type items: iterable
+        """
+        assert isinstance(txn, DbTransaction)
 
-            # add index entries for new value
-            _key = struct.pack('>H', index.pmap._slot) + index.pmap._serialize_key(index.fkey(value))
-            _data = index.pmap._serialize_value(key)
-            txn.put(_key, _data)
+        items = list(items)
+        datas = await self._encode_many(txn, [value for _, value in items])
+        for (key, value), _data in zip(items, datas):
+            assert key
+            self._put(txn, key, value, _data)
 
-            print('DB INDEX PUT:', index, key, _key, _data)
+    def _index_entries(self, key, value):
+        """
+        Get the index entries of a record in all indexes attached.
 
-    def __delitem__(self, txn_key):
+        :returns: The index entries (key and data).
+        :rtype: list
         """
+        pkey = self._serialize_key(key)
+        entries = []
+        for index in self._indexes:
+            entries.extend(index._index_entries(pkey, key, value).items())
+        return entries
 
-        :param txn_key:
-        :return:
+    def _index_changes(self, key, data, value):
         """
-        assert type(txn_key) == tuple and len(txn_key) == 2
+        Get the changes to the index entries for a record, given the previous value
+        of the record as stored in etcd and the new value.
 
-        txn, key = txn_key
+        :returns: The keys of the index entries to delete, and the index entries
+            (key and data) to put.
+        :rtype: tuple
+        """
+        previous = None
+        if data is not None:
+            previous = self._deserialize_value(self._decompress(data))
 
-        _key = struct.pack('>H', self._slot) + self._serialize_key(key)
+        pkey = self._serialize_key(key)
 
-        txn.delete(_key)
+        dels = []
+        puts = []
+        for index in self._indexes:
+            old_entries = index._index_entries(pkey, key, previous)
+            new_entries = index._index_entries(pkey, key, value)
+
+            # indexed (and projected) fields that did not change: nothing to write
+            for _key in old_entries:
+                if _key not in new_entries:
+                    dels.append(_key)
+            for _key, _data in new_entries.items():
+                if old_entries.get(_key) != _data:
+                    puts.append((_key, _data))
+        return dels, puts
 
-    async def delete(self, txn_key):
+    def __delitem__(self, txn_key):
         """
 
         :param txn_key:
@@ -284,15 +1166,18 @@ class PersistentMap(MutableMapping):
 
         _key = struct.pack('>H', self._slot) + self._serialize_key(key)
 
-        if self._indexes:
-            value = await self.__getitem__(txn_key)
-
         txn.delete(_key)
 
         if self._indexes:
-            for index in self._indexes:
-                _key = struct.pack('>H', index.pmap._slot) + index.pmap._serialize_key(index.fkey(value))
-                txn.delete(_key)
+            txn._update_indexes(self, _key, key, None)
+
+    async def delete(self, txn_key):
+        """
+
+        :param txn_key:
+        :return:
+        """
+        self.__delitem__(txn_key)
 
     def __len__(self):
         raise Exception('not implemented')
@@ -300,173 +1185,398 @@ class PersistentMap(MutableMapping):
     def __iter__(self):
         raise Exception('not implemented')
 
-    async def watch(self, txn, on_watch, from_key=None, to_key=None):
+    def watch(self, txn, on_watch, from_key=None, to_key=None, prefix=None):
         """
-
-        :param txn:
-        :param on_watch:
-        :param from_key:
-        :param to_key:
-        :return:
+        Watch the records in a key range (or with a key prefix) for changes following the
+        revision read by a transaction, and invoke a callback with the key and the new value
+        (or None, when deleted) of each changed record.
+
+        :param txn: The transaction, changes following the revision of which are watched.
+        :param on_watch: The callback to invoke with the key and value of changed records.
+        :param from_key: Start of the range (inclusive).
+        :param to_key: End of the range (exclusive).
+        :param prefix: Key prefix of the records to watch (instead of a range).
+        :return: The change feed, stop watching with ``close()``.
+        :rtype: instance of :class:`PersistentMapChanges`
         """
         assert callable(on_watch)
 
-        if from_key:
-            from_key = self._serialize_key(from_key)
-        else:
-            from_key = struct.pack('>H', self._slot)
+        changes = PersistentMapChanges(txn._db,
+                                       self,
+                                       from_revision=txn.revision + 1 if txn.revision else None,
+                                       from_key=from_key,
+                                       to_key=to_key,
+                                       prefix=prefix)
 
-        if to_key:
-            to_key = self._serialize_key(to_key)
-        else:
-            to_key = struct.pack('>H', self._slot + 1)
+        async def watch():
+            async for _, key, value, _, _ in changes:
+                try:
+                    on_watch(key, value)
+                except Exception as e:
+                    self.log.warn('exception raised from watch callback {callback} swallowed: {error}',
+                                  callback=on_watch,
+                                  error=e)
 
-        watching = await txn.watch(on_watch, from_key=from_key, to_key=to_key, keys_only=False)
+        ensureDeferred(watch()).addErrback(
+            lambda failure: self.log.warn('watching {pmap} failed: {error}', pmap=self, error=failure.value))
 
-        return watching
+        return changes
 
-    async def select(self, txn, from_key=None, to_key=None, return_keys=False, return_values=True):
+    def changes(self, db, from_revision=None, from_key=None, to_key=None, prefix=None):
         """
+        Receive the changes of records, iterating asynchronously over tuples
+        ``(op, key, new_value, old_value, revision)``:
+
+        .. code-block:: python
+
+            async for op, oid, user, previous, revision in users_table.changes(db, from_revision=rev):
+                if op == WatchEvent.DELETE:
+                    cache.pop(oid, None)
+                else:
+                    cache[oid] = user
+
+        ``op`` is ``WatchEvent.PUT`` or ``WatchEvent.DELETE``. ``new_value`` is None for deletes,
+        and ``old_value`` is None for new records (or when the previous value was compacted).
+
+        :param db: The database to watch.
+        :param from_revision: The etcd revision to receive changes from (inclusive), eg the
+            revision following the last change processed before, or the revision following
+            the revision of a transaction reading the records.
+        :param from_key: Start of the range (inclusive).
+        :param to_key: End of the range (exclusive).
+        :param prefix: Key prefix of the records (instead of a range), see :meth:`select`.
+        :return: The change feed, stop receiving changes with ``close()``.
+        :rtype: instance of :class:`PersistentMapChanges`
+        """
+        return PersistentMapChanges(db,
+                                    self,
+                                    from_revision=from_revision,
+                                    from_key=from_key,
+                                    to_key=to_key,
+                                    prefix=prefix)
+
+    def select(self,
+               txn,
+               from_key=None,
+               to_key=None,
+               return_keys=False,
+               return_values=True,
+               limit=None,
+               reverse=False,
+               page_size=None,
+               prefix=None):
+        """
+        Select records in a key range, or with a key prefix. The result can be awaited to get all records
+        as lists, or iterated asynchronously to read the records page by page:
+
+        .. code-block:: python
+
+            users = await users_table.select(txn)
+
+            async for oid, user in users_table.select(txn, return_keys=True, limit=100):
+                print(oid, user)
 
         :param txn:
-        :param from_key:
-        :param to_key:
+        :param from_key: Start of the range (inclusive), eg the key following the last
+            key of the previous page for cursor-style pagination.
+        :param to_key: End of the range (exclusive).
         :param return_keys:
         :param return_values:
-        :return:
+        :param limit: Maximum number of records to select.
+        :param reverse: Select in reverse key order.
+        :param page_size: Number of records read from etcd per page.
+        :param prefix: Key prefix of the records to select (instead of a range): for
+            composite keys a tuple of the leading parts of the keys, eg ``(parent_oid,)``
+            to select all children of a parent, and for string keys a string prefix.
+        :return: The iterator over the selected records.
+        :rtype: instance of :class:`PersistentMapIterator`
         """
         assert return_keys or return_values
 
-        if from_key:
-            from_key = self._serialize_key(from_key)
-        else:
-            from_key = struct.pack('>H', self._slot)
-
-        if to_key:
-            to_key = self._serialize_key(to_key)
-        else:
-            to_key = struct.pack('>H', self._slot + 1)
-
-        res_keys, res_values = None, None
-        result = await txn.get(from_key, range_end=to_key, keys_only=not return_values)
+        return PersistentMapIterator(txn,
+                                     self,
+                                     from_key=from_key,
+                                     to_key=to_key,
+                                     return_keys=return_keys,
+                                     return_values=return_values,
+                                     limit=limit,
+                                     reverse=reverse,
+                                     page_size=page_size,
+                                     prefix=prefix)
+
+    def select_by_index(self,
+                        txn,
+                        index,
+                        from_key=None,
+                        to_key=None,
+                        return_keys=False,
+                        return_values=True,
+                        limit=None,
+                        reverse=False,
+                        page_size=None,
+                        concurrency=4,
+                        projected=False,
+                        prefix=None):
+        """
+        Select records by a range of index keys, in index order. The result can be awaited
+        to get all records as lists, or iterated asynchronously:
 
-        if result:
-            if return_keys:
-                res_keys = []
+        .. code-block:: python
 
-            if return_values:
-                res_values = []
+            async for user in users_table.select_by_index(txn, users_by_name, from_key='a', to_key='b'):
+                print(user)
 
-            for kv in result:
-                if return_keys:
-                    data = kv.key[2:]
-                    obj = self._deserialize_key(data)
-                    res_keys.append(obj)
+        :param txn:
+        :param index: The index attached to this table to select by.
+        :param from_key: Start of the index range (inclusive).
+        :param to_key: End of the index range (exclusive).
+        :param return_keys:
+        :param return_values:
+        :param limit: Maximum number of records to select.
+        :param reverse: Select in reverse index order.
+        :param page_size: Number of index records read from etcd per page.
+        :param concurrency: Maximum number of etcd transactions reading records in parallel.
+        :param projected: Select the projections of the records stored in the (covering)
+            index instead of the values, reading the index only.
+        :param prefix: Prefix of the index keys to select by (instead of a range).
+        :return: The iterator over the selected records.
+        :rtype: instance of :class:`PersistentMapIndexIterator`
+        """
+        assert return_keys or return_values
 
-                if return_values:
-                    data = kv.value
-                    if self._decompress:
-                        data = self._decompress(data)
-                    obj = self._deserialize_value(data)
-                    res_values.append(obj)
+        if index not in self._indexes:
+            raise IndexError('no such index attached')
 
-        if return_keys and return_values:
-            return res_keys, res_values
-        elif return_keys:
-            return res_keys
-        elif return_values:
-            return res_values
-        else:
-            raise Exception('logic error')
+        if projected and not index.projection:
+            raise Exception('index has no projection')
+
+        return PersistentMapIndexIterator(txn,
+                                          self,
+                                          index,
+                                          from_key=from_key,
+                                          to_key=to_key,
+                                          return_keys=return_keys,
+                                          return_values=return_values,
+                                          limit=limit,
+                                          reverse=reverse,
+                                          page_size=page_size,
+                                          concurrency=concurrency,
+                                          projected=projected,
+                                          prefix=prefix)
 
     async def count(self, txn, prefix=None):
         """
 
         :param txn:
-        :param prefix:
+        :param prefix: Key prefix of the records to count, see :meth:`select`.
         :return:
         """
-        from_key = struct.pack('>H', self._slot)
-        if prefix:
-            from_key += self._serialize_key(prefix)
-            to_key = ((int.from_bytes(from_key, byteorder='big') + 1).to_bytes(
-                len(from_key), byteorder='big'))
-        else:
-            to_key = struct.pack('>H', self._slot + 1)
+        from_key, to_key = self._key_range(prefix=prefix)
 
         result = await txn.get(from_key, range_end=to_key, count_only=True)
         return result
 
-    def truncate(self, txn, rebuild_indexes=True):
+    async def truncate(self, txn, rebuild_indexes=True):
         """
+        Delete all records, with a single etcd operation deleting the key range of the table.
 
-        :param txn:
-        :param rebuild_indexes:
-        :return:
+        :param txn: The (write) transaction to delete in.
+        :param rebuild_indexes: Also delete all records of the indexes attached.
+        :return: The number of records deleted from this table (not counting the index
+            records deleted).
         """
-        key_from = struct.pack('>H', self._slot)
-        key_to = struct.pack('>H', self._slot + 1)
-        cursor = txn._txn.cursor()
-        cnt = 0
-        if cursor.set_range(key_from):
-            key = cursor.key()
-            while key < key_to:
-                if not cursor.delete(dupdata=True):
-                    break
-                cnt += 1
-                if txn._stats:
-                    txn._stats.dels += 1
+        key_from, key_to = self._key_range()
+
+        cnt = await txn.get(key_from, range_end=key_to, count_only=True)
+        txn.delete(key_from, range_end=key_to)
+
         if rebuild_indexes:
-            deleted, _ = self.rebuild_indexes(txn)
-            cnt += deleted
+            # with no records left, rebuilding the indexes means truncating them
+            for index in self._indexes:
+                await index.pmap.truncate(txn)
+
         return cnt
 
-    def rebuild_indexes(self, txn):
+    async def rebuild_indexes(self, db, concurrency=4, page_size=None, on_progress=None):
         """
-
-        :param txn:
-        :return:
+        Rebuild all indexes attached from the records in this table.
+
+        :param db: The database to rebuild the indexes in.
+        :param concurrency:
+        :param page_size:
+        :param on_progress:
+        :return: The total numbers of index records deleted and inserted.
+        :rtype: tuple
         """
         total_deleted = 0
         total_inserted = 0
         for index in self._indexes:
-            deleted, inserted = index.rebuild(txn, index)
+            deleted, inserted = await self.rebuild_index(db,
+                                                         index,
+                                                         concurrency=concurrency,
+                                                         page_size=page_size,
+                                                         on_progress=on_progress)
             total_deleted += deleted
             total_inserted += inserted
         return total_deleted, total_inserted
 
-    def rebuild_index(self, txn, index):
+    async def rebuild_index(self, db, index, concurrency=4, page_size=None, on_progress=None):
         """
+        Rebuild an index attached from the records in this table.
 
-        :param txn:
-        :param index:
-        :return:
+        The index is truncated first. The records are then read page by page from a
+        snapshot of the table, and the index records are written in write transactions
+        that each fill one etcd transaction, with up to ``concurrency`` transactions
+        committing in parallel. Rebuilding is not atomic, and records modified while
+        rebuilding might not be reflected in the index.
+
+        :param db: The database to rebuild the index in.
+        :type db: instance of :class:`txaioetcd.Database`
+
+        :param index: The index to rebuild.
+        :type index: instance of :class:`txaioetcd._pmap.Index`
+
+        :param concurrency: Maximum number of transactions committing in parallel.
+        :type concurrency: int
+
+        :param page_size: Number of records read from etcd per page.
+        :type page_size: int or None
+
+        :param on_progress: Called with the number of records indexed and the total
+            number of records after each transaction.
+        :type on_progress: callable or None
+
+        :return: The numbers of index records deleted and inserted.
+        :rtype: tuple
         """
-        if index in self._indexes:
+        assert type(concurrency) in six.integer_types and concurrency > 0
+        assert on_progress is None or callable(on_progress)
+
+        if index not in self._indexes:
+            raise IndexError('no such index attached')
 
-            deleted = index.pmap.truncate(txn)
+        started = walltime()
 
-            key_from = struct.pack('>H', self._slot)
-            key_to = struct.pack('>H', self._slot + 1)
-            cursor = txn._txn.cursor()
-            inserted = 0
-            if cursor.set_range(key_from):
-                while cursor.key() < key_to:
-                    data = cursor.value()
-                    if data:
-                        value = self._deserialize_value(data)
+        async with db.begin(write=True) as txn:
+            deleted = await index.pmap.truncate(txn)
 
-                        _key = struct.pack('>H', index.pmap._slot) + index.pmap._serialize_key(
-                            index.fkey(value))
-                        _data = index.pmap._serialize_value(value.oid)
+        # records indexed, index records inserted and total records
+        indexed = [0]
+        inserted = [0]
+        total = [0]
 
+        async def write(chunk):
+            async with db.begin(write=True, oversize=DbTransaction.OVERSIZE_SPLIT) as txn:
+                for key, value in chunk:
+                    for _key, _data in index._index_entries(self._serialize_key(key), key, value).items():
                         txn.put(_key, _data)
-                        inserted += 1
-                    if not cursor.next():
-                        break
-            return deleted, inserted
+                        inserted[0] += 1
+            indexed[0] += len(chunk)
+            if on_progress:
+                on_progress(indexed[0], total[0])
+            self.log.debug('DB index rebuild: {indexed} of {total} records indexed ({rate} records/s)',
+                           indexed=indexed[0],
+                           total=total[0],
+                           rate=int(indexed[0] / max(walltime() - started, 1e-6)))
+
+        chunk_size = db._max_txn_ops
+        writing = []
+        try:
+            async with db.begin() as txn:
+                total[0] = await self.count(txn)
+
+                chunk = []
+                records = self.select(txn, return_keys=True, page_size=page_size)
+                try:
+                    async for record in records:
+                        chunk.append(record)
+                        if len(chunk) >= chunk_size:
+                            if len(writing) >= concurrency:
+                                await writing.pop(0)
+                            writing.append(ensureDeferred(write(chunk)))
+                            chunk = []
+                except Exception:
+                    await records._stop()
+                    raise
+                if chunk:
+                    writing.append(ensureDeferred(write(chunk)))
+            while writing:
+                await writing.pop(0)
+        except Exception:
+            # wait for the transactions still committing, and raise the first error only
+            await DeferredList(writing, consumeErrors=True)
+            raise
+
+        duration = walltime() - started
+        self.log.info(
+            'DB index rebuild: {indexed} records indexed in {index_pmap} from {pmap} in {duration} s '
+            '({rate} records/s, {inserted} index records)',
+            indexed=indexed[0],
+            inserted=inserted[0],
+            index_pmap=index.pmap,
+            pmap=self,
+            duration=round(duration, 3),
+            rate=int(indexed[0] / max(duration, 1e-6)))
+
+        return deleted, inserted[0]
+
+
+class _OidKeysMixin(_types._OidKeysMixin):
+    """
+    OID keys, decoded in bulk from the etcd keys of a batch of records.
+    """
+
+    def _deserialize_keys(self, _keys):
+        data = b''.join(_keys)
+        if len(data) != 10 * len(_keys):
+            return PersistentMap._deserialize_keys(self, _keys)
+
+        if HAS_NUMPY:
+            return numpy.frombuffer(data, dtype=_OID_KEYS_DTYPE)['oid'].tolist()
         else:
-            raise IndexError('no such index attached')
+            return [oid for _, oid in struct.iter_unpack('>HQ', data)]
+
+
+class _UuidKeysMixin(_types._UuidKeysMixin):
+    """
+    UUID keys, decoded in bulk from the etcd keys of a batch of records.
+    """
+
+    def _deserialize_keys(self, _keys):
+        data = b''.join(_keys)
+        if len(data) != 18 * len(_keys):
+            return PersistentMap._deserialize_keys(self, _keys)
+
+        return _uuids((high << 64) | low for _, high, low in struct.iter_unpack('>HQQ', data))
+
+
+class _FlatBuffersValuesMixin(_types._FlatBuffersValuesMixin):
+    """
+    FlatBuffers values, cast from memoryviews over the buffers read from etcd.
+
+    Casting a FlatBuffers table only wraps the buffer, and fields are read from the
+    buffer when accessed. Neither stripping the codec tag of uncompressed values nor
+    casting copies the value, so that scanning FlatBuffers tables runs close to
+    buffer speed.
+    """
+
+    def _decompress_view(self, data):
+        if six.indexbytes(data, 0) == PersistentMap._COMPRESS_NONE:
+            return memoryview(data)[1:]
+        else:
+            return memoryview(self._decompress(data))
+
+    def _decode_values(self, datas):
+        started = walltime()
+        if self._compress_mode:
+            views = [self._decompress_view(_data) for _data in datas]
+        else:
+            views = [memoryview(_data) for _data in datas]
+        decompress_time = walltime() - started
+
+        cast = self._cast
+        values = [cast(view) for view in views]
+        return values, decompress_time, walltime() - started - decompress_time
 
 
 #
@@ -479,11 +1589,13 @@ class MapSlotUuidUuid(_types._SlotUuidKeysMixin, _types._UuidValuesMixin, Persis
     Persistent map with (slot, UUID) and UUID values.
     """
 
+    KEY_PARTS = (_slot_key_part, _uuid_key_part)
+
     def __init__(self, slot=None, compress=None):
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapUuidString(_types._UuidKeysMixin, _types._StringValuesMixin, PersistentMap):
+class MapUuidString(_UuidKeysMixin, _types._StringValuesMixin, PersistentMap):
     """
     Persistent map with UUID (16 bytes) keys and string (utf8) values.
     """
@@ -492,7 +1604,7 @@ class MapUuidString(_types._UuidKeysMixin, _types._StringValuesMixin, Persistent
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapUuidOid(_types._UuidKeysMixin, _types._OidValuesMixin, PersistentMap):
+class MapUuidOid(_UuidKeysMixin, _types._OidValuesMixin, PersistentMap):
     """
     Persistent map with UUID (16 bytes) keys and OID (uint64) values.
     """
@@ -501,7 +1613,7 @@ class MapUuidOid(_types._UuidKeysMixin, _types._OidValuesMixin, PersistentMap):
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapUuidUuid(_types._UuidKeysMixin, _types._UuidValuesMixin, PersistentMap):
+class MapUuidUuid(_UuidKeysMixin, _types._UuidValuesMixin, PersistentMap):
     """
     Persistent map with UUID (16 bytes) keys and UUID (16 bytes) values.
     """
@@ -510,7 +1622,7 @@ class MapUuidUuid(_types._UuidKeysMixin, _types._UuidValuesMixin, PersistentMap)
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapUuidUuidSet(_types._UuidKeysMixin, _types._UuidSetValuesMixin, PersistentMap):
+class MapUuidUuidSet(_UuidKeysMixin, _types._UuidSetValuesMixin, PersistentMap):
     """
     Persistent map with UUID keys and UUID set values.
     """
@@ -524,6 +1636,8 @@ class MapUuidStringUuid(_types._UuidStringKeysMixin, _types._UuidValuesMixin, Pe
     Persistent map with (UUID, string) keys and UUID values.
     """
 
+    KEY_PARTS = (_uuid_key_part, _string_key_part)
+
     def __init__(self, slot=None, compress=None):
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
@@ -533,11 +1647,13 @@ class MapUuidUuidUuid(_types._UuidUuidKeysMixin, _types._UuidValuesMixin, Persis
     Persistent map with (UUID, UUID) keys and UUID values.
     """
 
+    KEY_PARTS = (_uuid_key_part, _uuid_key_part)
+
     def __init__(self, slot=None, compress=None):
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapUuidJson(_types._UuidKeysMixin, _types._JsonValuesMixin, PersistentMap):
+class MapUuidJson(_UuidKeysMixin, _types._JsonValuesMixin, PersistentMap):
     """
     Persistent map with UUID (16 bytes) keys and JSON values.
     """
@@ -547,7 +1663,7 @@ class MapUuidJson(_types._UuidKeysMixin, _types._JsonValuesMixin, PersistentMap)
         _types._JsonValuesMixin.__init__(self, marshal=marshal, unmarshal=unmarshal)
 
 
-class MapUuidCbor(_types._UuidKeysMixin, _types._CborValuesMixin, PersistentMap):
+class MapUuidCbor(_UuidKeysMixin, _types._CborValuesMixin, PersistentMap):
     """
     Persistent map with UUID (16 bytes) keys and CBOR values.
     """
@@ -562,12 +1678,14 @@ class MapUuidUuidCbor(_types._UuidUuidKeysMixin, _types._CborValuesMixin, Persis
     Persistent map with (UUID, UUID) keys and CBOR values.
     """
 
+    KEY_PARTS = (_uuid_key_part, _uuid_key_part)
+
     def __init__(self, slot=None, compress=None, marshal=None, unmarshal=None):
         PersistentMap.__init__(self, slot=slot, compress=compress)
         _types._CborValuesMixin.__init__(self, marshal=marshal, unmarshal=unmarshal)
 
 
-class MapUuidPickle(_types._UuidKeysMixin, _types._PickleValuesMixin, PersistentMap):
+class MapUuidPickle(_UuidKeysMixin, _types._PickleValuesMixin, PersistentMap):
     """
     Persistent map with UUID (16 bytes) keys and Python Pickle values.
     """
@@ -576,14 +1694,14 @@ class MapUuidPickle(_types._UuidKeysMixin, _types._PickleValuesMixin, Persistent
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapUuidFlatBuffers(_types._UuidKeysMixin, _types._FlatBuffersValuesMixin, PersistentMap):
+class MapUuidFlatBuffers(_UuidKeysMixin, _FlatBuffersValuesMixin, PersistentMap):
     """
     Persistent map with UUID (16 bytes) keys and FlatBuffers values.
     """
 
     def __init__(self, slot=None, compress=None, build=None, cast=None):
         PersistentMap.__init__(self, slot=slot, compress=compress)
-        _types._FlatBuffersValuesMixin.__init__(self, build=build, cast=cast)
+        _FlatBuffersValuesMixin.__init__(self, build=build, cast=cast)
 
 
 #
@@ -647,14 +1765,14 @@ class MapStringPickle(_types._StringKeysMixin, _types._PickleValuesMixin, Persis
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapStringFlatBuffers(_types._StringKeysMixin, _types._FlatBuffersValuesMixin, PersistentMap):
+class MapStringFlatBuffers(_types._StringKeysMixin, _FlatBuffersValuesMixin, PersistentMap):
     """
     Persistent map with string (utf8) keys and FlatBuffers values.
     """
 
     def __init__(self, slot=None, compress=None, build=None, cast=None):
         PersistentMap.__init__(self, slot=slot, compress=compress)
-        _types._FlatBuffersValuesMixin.__init__(self, build=build, cast=cast)
+        _FlatBuffersValuesMixin.__init__(self, build=build, cast=cast)
 
 
 #
@@ -662,7 +1780,7 @@ class MapStringFlatBuffers(_types._StringKeysMixin, _types._FlatBuffersValuesMix
 #
 
 
-class MapOidString(_types._OidKeysMixin, _types._StringValuesMixin, PersistentMap):
+class MapOidString(_OidKeysMixin, _types._StringValuesMixin, PersistentMap):
     """
     Persistent map with OID (uint64) keys and string (utf8) values.
     """
@@ -671,7 +1789,7 @@ class MapOidString(_types._OidKeysMixin, _types._StringValuesMixin, PersistentMa
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapOidOid(_types._OidKeysMixin, _types._OidValuesMixin, PersistentMap):
+class MapOidOid(_OidKeysMixin, _types._OidValuesMixin, PersistentMap):
     """
     Persistent map with OID (uint64) keys and OID (uint64) values.
     """
@@ -680,7 +1798,7 @@ class MapOidOid(_types._OidKeysMixin, _types._OidValuesMixin, PersistentMap):
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapOidUuid(_types._OidKeysMixin, _types._UuidValuesMixin, PersistentMap):
+class MapOidUuid(_OidKeysMixin, _types._UuidValuesMixin, PersistentMap):
     """
     Persistent map with OID (uint64) keys and UUID (16 bytes) values.
     """
@@ -689,7 +1807,7 @@ class MapOidUuid(_types._OidKeysMixin, _types._UuidValuesMixin, PersistentMap):
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapOidJson(_types._OidKeysMixin, _types._JsonValuesMixin, PersistentMap):
+class MapOidJson(_OidKeysMixin, _types._JsonValuesMixin, PersistentMap):
     """
     Persistent map with OID (uint64) keys and JSON values.
     """
@@ -699,7 +1817,7 @@ class MapOidJson(_types._OidKeysMixin, _types._JsonValuesMixin, PersistentMap):
         _types._JsonValuesMixin.__init__(self, marshal=marshal, unmarshal=unmarshal)
 
 
-class MapOidCbor(_types._OidKeysMixin, _types._CborValuesMixin, PersistentMap):
+class MapOidCbor(_OidKeysMixin, _types._CborValuesMixin, PersistentMap):
     """
     Persistent map with OID (uint64) keys and CBOR values.
     """
@@ -709,7 +1827,7 @@ class MapOidCbor(_types._OidKeysMixin, _types._CborValuesMixin, PersistentMap):
         _types._CborValuesMixin.__init__(self, marshal=marshal, unmarshal=unmarshal)
 
 
-class MapOidPickle(_types._OidKeysMixin, _types._PickleValuesMixin, PersistentMap):
+class MapOidPickle(_OidKeysMixin, _types._PickleValuesMixin, PersistentMap):
     """
     Persistent map with OID (uint64) keys and Python pickle values.
     """
@@ -718,11 +1836,11 @@ class MapOidPickle(_types._OidKeysMixin, _types._PickleValuesMixin, PersistentMa
         PersistentMap.__init__(self, slot=slot, compress=compress)
 
 
-class MapOidFlatBuffers(_types._OidKeysMixin, _types._FlatBuffersValuesMixin, PersistentMap):
+class MapOidFlatBuffers(_OidKeysMixin, _FlatBuffersValuesMixin, PersistentMap):
     """
     Persistent map with OID (uint64) keys and FlatBuffers values.
     """
 
     def __init__(self, slot=None, compress=None, build=None, cast=None):
         PersistentMap.__init__(self, slot=slot, compress=compress)
-        _types._FlatBuffersValuesMixin.__init__(self, build=build, cast=cast)
+        _FlatBuffersValuesMixin.__init__(self, build=build, cast=cast)
@@ -27,27 +27,85 @@
 from __future__ import absolute_import
 
 import binascii
-import base64
+import copy
+import json
+import re
 
 import six
 
 __all__ = ('KeySet', 'KeyValue', 'Header', 'Status', 'Deleted', 'Revision', 'Comp', 'CompValue',
            'CompVersion', 'CompCreated', 'CompModified', 'Op', 'OpGet', 'OpSet', 'OpDel', 'Transaction',
-           'Error', 'Failed', 'Success', 'Expired', 'Range')
+           'Param', 'PreparedTransaction', 'Error', 'Failed', 'Success', 'Expired', 'Range', 'CasResult')
+
+MAX_TXN_OPS = 128
+"""
+Maximum number of operations per transaction accepted by etcd (default of the etcd
+server option ``--max-txn-ops``). This applies to each of the compare, success and
+failure lists of a transaction separately.
+"""
+
+MAX_REQUEST_BYTES = 1572864
+"""
+Maximum size of a client request in bytes accepted by etcd (default of the etcd server
+option ``--max-request-bytes``).
+"""
 
 
 def _increment_last_byte(byte_string):
     """
-    Increment a byte string by 1 - this is used for etcd prefix gets/watches.
+    Compute the range end for all keys having a byte string as prefix - this is used for
+    etcd prefix gets/watches.
 
-    FIXME: This function is doing it wrong when the last octet equals 0xFF.
-    FIXME: This function is doing it wrong when the byte_string is of length 0
+    Trailing 0xFF octets are dropped before incrementing the last octet. When no octet
+    remains (or the byte string is of length 0), the range end is ``\\0``, which means
+    all keys (with the prefix).
     """
-    s = bytearray(byte_string)
+    s = bytearray(byte_string).rstrip(b'\xff')
+    if not s:
+        return b'\0'
     s[-1] = s[-1] + 1
     return bytes(s)
 
 
+try:
+    binascii.b2a_base64(b'', newline=False)
+except TypeError:
+    # Python 2 / < 3.6: no newline parameter
+    def _b64encode(data):
+        return binascii.b2a_base64(data)[:-1].decode('ascii')
+else:
+
+    def _b64encode(data):
+        return binascii.b2a_base64(data, newline=False).decode('ascii')
+
+
+# this skips the argument conversions and checks done in base64.b64decode
+_b64decode = binascii.a2b_base64
+
+
+class _Marshalled(object):
+    """
+    Mixin for objects that cache their marshalled form.
+
+    Classes using the mixin implement ``_state()``, returning the state the marshalled form
+    depends on, and ``_build()``, returning the marshalled form.
+
+    The marshalled form is rebuilt only when the state returned by ``_state()`` changes,
+    so objects submitted repeatedly (eg in a retry loop) are only encoded once. The
+    marshalled form returned is shared and must not be modified by the caller.
+    """
+
+    _marshalled = None
+
+    def _marshal(self):
+        state = self._state()
+        marshalled = self._marshalled
+        if marshalled is None or marshalled[0] != state:
+            marshalled = (state, self._build())
+            self._marshalled = marshalled
+        return marshalled[1]
+
+
 def _maybe_text(data):
     try:
         return u'{}'.format(data)
@@ -55,7 +113,35 @@ def _maybe_text(data):
         return binascii.b2a_hex(data).decode()
 
 
-class KeySet(object):
+class Param(object):
+    """
+    A named parameter slot in a transaction that is prepared once and submitted
+    many times with different values (see :meth:`txaioetcd.Transaction.prepare`).
+
+    Parameters can be used in place of the value of :class:`txaioetcd.CompValue`
+    and :class:`txaioetcd.OpSet`, the version or revision of :class:`txaioetcd.CompVersion`,
+    :class:`txaioetcd.CompCreated` and :class:`txaioetcd.CompModified`, the lease of
+    :class:`txaioetcd.OpSet` and the revision of :class:`txaioetcd.OpGet`.
+
+    :ivar name: The parameter name.
+    :vartype name: str
+    """
+
+    def __init__(self, name):
+        """
+
+        :param name: The parameter name, used when binding values to the prepared transaction.
+        :type name: str
+        """
+        if type(name) not in (six.text_type, str):
+            raise TypeError('name must be a string, not {}'.format(type(name)))
+        self.name = name
+
+    def __str__(self):
+        return u'Param(name={})'.format(self.name)
+
+
+class KeySet(_Marshalled):
     """
     Represents a set of etcd keys. Either a single key, a key range or
     all keys with a given prefix.
@@ -91,6 +177,9 @@ class KeySet(object):
         if prefix and range_end:
             raise TypeError('either range_end or prefix can be set, but not both')
 
+        self._init(key, range_end, prefix)
+
+    def _init(self, key, range_end, prefix):
         self.key = key
         self.range_end = range_end
         self.prefix = prefix
@@ -102,8 +191,20 @@ class KeySet(object):
         else:
             self.type = KeySet._SINGLE
 
-    def _marshal(self):
-        obj = {u'key': base64.b64encode(self.key).decode()}
+    @staticmethod
+    def _create(key, range_end=None, prefix=None):
+        """
+        Create a key set without checking the arguments (for key sets built by txaioetcd itself).
+        """
+        key_set = KeySet.__new__(KeySet)
+        key_set._init(key, range_end, prefix)
+        return key_set
+
+    def _state(self):
+        return self.key, self.range_end, self.type
+
+    def _build(self):
+        obj = {u'key': _b64encode(self.key)}
 
         if self.type == KeySet._SINGLE:
             range_end = None
@@ -115,7 +216,7 @@ class KeySet(object):
             raise Exception('logic error')
 
         if range_end:
-            obj[u'range_end'] = base64.b64encode(range_end).decode()
+            obj[u'range_end'] = _b64encode(range_end)
 
         return obj
 
@@ -163,12 +264,18 @@ class KeyValue(object):
         #     'mod_revision': '357'
         # }
 
-        key = base64.b64decode(obj[u'key']) if u'key' in obj else None
-        value = base64.b64decode(obj[u'value']) if u'value' in obj else None
-        version = int(obj[u'version']) if u'version' in obj else None
-        create_revision = int(obj[u'create_revision']) if u'create_revision' in obj else None
-        mod_revision = int(obj[u'mod_revision']) if u'mod_revision' in obj else None
-        return KeyValue(key, value, version, create_revision, mod_revision)
+        get = obj.get
+        key = get(u'key', None)
+        value = get(u'value', None)
+        version = get(u'version', None)
+        create_revision = get(u'create_revision', None)
+        mod_revision = get(u'mod_revision', None)
+        return KeyValue(
+            _b64decode(key) if key is not None else None,
+            _b64decode(value) if value is not None else None,
+            int(version) if version is not None else None,
+            int(create_revision) if create_revision is not None else None,
+            int(mod_revision) if mod_revision is not None else None)
 
     def __str__(self):
         return u'KeyValue(key={}, value={}, version={}, create_revision={}, mod_revision={})'.format(
@@ -209,17 +316,113 @@ class Header(object):
         #     u'cluster_id': u'243774308834426361',
         #     u'member_id': u'17323375927490080838'
         # }
-        raft_term = int(obj[u'raft_term']) if u'raft_term' in obj else None
-        revision = int(obj[u'revision']) if u'revision' in obj else None
-        cluster_id = int(obj[u'cluster_id']) if u'cluster_id' in obj else None
-        member_id = int(obj[u'member_id']) if u'member_id' in obj else None
-        return Header(raft_term, revision, cluster_id, member_id)
+        get = obj.get
+        raft_term = get(u'raft_term', None)
+        revision = get(u'revision', None)
+        cluster_id = get(u'cluster_id', None)
+        member_id = get(u'member_id', None)
+        return Header(
+            int(raft_term) if raft_term is not None else None,
+            int(revision) if revision is not None else None,
+            int(cluster_id) if cluster_id is not None else None,
+            int(member_id) if member_id is not None else None)
 
     def __str__(self):
         return u'Header(raft_term={}, revision={}, cluster_id={}, member_id={})'.format(
             self.raft_term, self.revision, self.cluster_id, self.member_id)
 
 
+class WatchEvent(object):
+    """
+    An event on a watched key.
+
+    :ivar type: The type of the event, either ``WatchEvent.PUT`` or ``WatchEvent.DELETE``.
+    :vartype type: str
+
+    :ivar kv: The key-value after the event (for deletes only the key and the revision).
+    :vartype kv: instance of :class:`txaioetcd.KeyValue`
+
+    :ivar prev_kv: The key-value before the event (if requested, and not yet compacted).
+    :vartype prev_kv: instance of :class:`txaioetcd.KeyValue` or None
+    """
+
+    PUT = u'PUT'
+    DELETE = u'DELETE'
+
+    def __init__(self, type, kv, prev_kv=None):
+        self.type = type
+        self.kv = kv
+        self.prev_kv = prev_kv
+
+    @staticmethod
+    def _parse(obj):
+        # {
+        #     u'type': u'DELETE',
+        #     u'kv': {u'key': u'bXlrZXkz', u'mod_revision': u'362'},
+        #     u'prev_kv': {...}
+        # }
+        prev_kv = obj.get(u'prev_kv', None)
+        return WatchEvent(
+            obj.get(u'type', WatchEvent.PUT),
+            KeyValue._parse(obj[u'kv']),
+            KeyValue._parse(prev_kv) if prev_kv is not None else None)
+
+    def __str__(self):
+        return u'WatchEvent(type={}, kv={}, prev_kv={})'.format(self.type, self.kv, self.prev_kv)
+
+
+class WatchResponse(object):
+    """
+    A response received from watching etcd.
+
+    :ivar header: Response header. For responses without events (progress notifications),
+        all events up to the revision of the header have been received.
+    :vartype header: instance of :class:`txaioetcd.Header`
+
+    :ivar events: The events, in revision order.
+    :vartype events: list of instance of :class:`txaioetcd.WatchEvent`
+
+    :ivar created: Whether this is the response to creating the watch.
+    :vartype created: bool
+
+    :ivar canceled: Whether the watch was canceled by etcd.
+    :vartype canceled: bool
+
+    :ivar compact_revision: If the watch was canceled because the start revision was
+        compacted, the compaction revision.
+    :vartype compact_revision: int or None
+    """
+
+    def __init__(self, header, events, created=False, canceled=False, compact_revision=None):
+        self.header = header
+        self.events = events
+        self.created = created
+        self.canceled = canceled
+        self.compact_revision = compact_revision
+
+    @staticmethod
+    def _parse(obj):
+        # {
+        #     u'header': {...},
+        #     u'events': [...],
+        #     u'created': True,
+        #     u'canceled': True,
+        #     u'compact_revision': u'355'
+        # }
+        compact_revision = obj.get(u'compact_revision', None)
+        return WatchResponse(
+            Header._parse(obj[u'header']) if u'header' in obj else None,
+            [WatchEvent._parse(evt) for evt in obj.get(u'events', [])],
+            obj.get(u'created', False),
+            obj.get(u'canceled', False),
+            int(compact_revision) if compact_revision else None)
+
+    def __str__(self):
+        return u'WatchResponse(header={}, events=[{}], created={}, canceled={}, compact_revision={})'.format(
+            self.header, u', '.join(str(evt) for evt in self.events), self.created, self.canceled,
+            self.compact_revision)
+
+
 class Status(object):
     """
     etcd cluster status.
@@ -300,7 +503,7 @@ class Deleted(object):
         self.previous = previous or []
 
     @staticmethod
-    def _parse(obj):
+    def _parse(obj, header=None):
 
         # {
         #     u'deleted': u'1',
@@ -336,11 +539,10 @@ class Deleted(object):
         # }
 
         deleted = int(obj[u'deleted']) if u'deleted' in obj else None
-        header = Header._parse(obj[u'header']) if u'header' in obj else None
+        if header is None and u'header' in obj:
+            header = Header._parse(obj[u'header'])
         if u'prev_kvs' in obj:
-            previous = []
-            for kv in obj[u'prev_kvs']:
-                previous.append(KeyValue._parse(kv))
+            previous = [KeyValue._parse(kv) for kv in obj[u'prev_kvs']]
         else:
             previous = None
         return Deleted(deleted, header, previous)
@@ -375,7 +577,7 @@ class Revision(object):
         self.previous = previous
 
     @staticmethod
-    def _parse(obj):
+    def _parse(obj, header=None):
 
         # {
         #     u'header':
@@ -407,7 +609,8 @@ class Revision(object):
         #     }
         # }
 
-        header = Header._parse(obj[u'header']) if u'header' in obj else None
+        if header is None and u'header' in obj:
+            header = Header._parse(obj[u'header'])
         if u'prev_kv' in obj:
             previous = KeyValue._parse(obj[u'prev_kv'])
         else:
@@ -418,7 +621,7 @@ class Revision(object):
         return u'Revision(header={}, previous={})'.format(self.header, self.previous)
 
 
-class Comp(object):
+class Comp(_Marshalled):
     """
     Base class for representing comparisons against a KV item.
 
@@ -439,6 +642,12 @@ class Comp(object):
     etcd API: CompareCompareResult
     """
 
+    range_end = None
+    """
+    If set, the comparison applies to all keys in the range from the key to this (exclusive)
+    end (only used for comparisons built by txaioetcd itself).
+    """
+
     def __init__(self, key, compare):
         if type(key) != six.binary_type:
             raise TypeError('key must be bytes type, not {}'.format(type(key)))
@@ -446,11 +655,28 @@ class Comp(object):
         if compare not in Comp.OPERATORS:
             raise TypeError('compare must be one of {}, not "{}"'.format(Comp.OPERATORS, compare))
 
+        Comp._init(self, key, compare)
+
+    def _init(self, key, compare):
         self.key = key
         self.compare = compare
 
-    def _marshal(self):
-        obj = {u'key': base64.b64encode(self.key).decode(), u'result': Comp.OPERATORS[self.compare]}
+    @classmethod
+    def _create(cls, key, compare, *args):
+        """
+        Create a comparison without checking the arguments (for comparisons built by txaioetcd itself).
+        """
+        comp = cls.__new__(cls)
+        comp._init(key, compare, *args)
+        return comp
+
+    def _state(self):
+        return self.key, self.compare
+
+    def _build(self):
+        obj = {u'key': _b64encode(self.key), u'result': Comp.OPERATORS[self.compare]}
+        if self.range_end:
+            obj[u'range_end'] = _b64encode(self.range_end)
         return obj
 
     def __str__(self):
@@ -474,15 +700,22 @@ class CompValue(Comp):
     def __init__(self, key, compare, value):
         Comp.__init__(self, key, compare)
 
-        if type(value) != six.binary_type:
+        if type(value) != six.binary_type and not isinstance(value, Param):
             raise TypeError('value must be bytes type, not {}'.format(type(value)))
 
+        CompValue._init(self, key, compare, value)
+
+    def _init(self, key, compare, value):
+        Comp._init(self, key, compare)
         self.value = value
 
-    def _marshal(self):
-        obj = Comp._marshal(self)
+    def _state(self):
+        return self.key, self.compare, self.value
+
+    def _build(self):
+        obj = Comp._build(self)
         obj[u'target'] = u'VALUE'  # CompareCompareTarget
-        obj[u'value'] = base64.b64encode(self.value).decode()
+        obj[u'value'] = _b64encode(self.value)
         return obj
 
     def __str__(self):
@@ -507,13 +740,20 @@ class CompVersion(Comp):
     def __init__(self, key, compare, version):
         Comp.__init__(self, key, compare)
 
-        if type(version) not in six.integer_types:
+        if type(version) not in six.integer_types and not isinstance(version, Param):
             raise TypeError('version must be an integer type, not {}'.format(type(version)))
 
+        CompVersion._init(self, key, compare, version)
+
+    def _init(self, key, compare, version):
+        Comp._init(self, key, compare)
         self.version = version
 
-    def _marshal(self):
-        obj = Comp._marshal(self)
+    def _state(self):
+        return self.key, self.compare, self.version
+
+    def _build(self):
+        obj = Comp._build(self)
         obj[u'target'] = u'VERSION'  # CompareCompareTarget
         obj[u'version'] = self.version
         return obj
@@ -540,13 +780,20 @@ class CompCreated(Comp):
     def __init__(self, key, compare, create_revision):
         Comp.__init__(self, key, compare)
 
-        if type(create_revision) not in six.integer_types:
+        if type(create_revision) not in six.integer_types and not isinstance(create_revision, Param):
             raise TypeError('create_revision must be an integer type, not {}'.format(type(create_revision)))
 
+        CompCreated._init(self, key, compare, create_revision)
+
+    def _init(self, key, compare, create_revision):
+        Comp._init(self, key, compare)
         self.create_revision = create_revision
 
-    def _marshal(self):
-        obj = Comp._marshal(self)
+    def _state(self):
+        return self.key, self.compare, self.create_revision
+
+    def _build(self):
+        obj = Comp._build(self)
         obj[u'target'] = u'CREATE'  # CompareCompareTarget
         obj[u'create_revision'] = self.create_revision
         return obj
@@ -573,13 +820,20 @@ class CompModified(Comp):
     def __init__(self, key, compare, mod_revision):
         Comp.__init__(self, key, compare)
 
-        if type(mod_revision) not in six.integer_types:
+        if type(mod_revision) not in six.integer_types and not isinstance(mod_revision, Param):
             raise TypeError('mod_revision must be an integer type, not {}'.format(type(mod_revision)))
 
+        CompModified._init(self, key, compare, mod_revision)
+
+    def _init(self, key, compare, mod_revision):
+        Comp._init(self, key, compare)
         self.mod_revision = mod_revision
 
-    def _marshal(self):
-        obj = Comp._marshal(self)
+    def _state(self):
+        return self.key, self.compare, self.mod_revision, self.range_end
+
+    def _build(self):
+        obj = Comp._build(self)
         obj[u'target'] = u'MOD'  # CompareCompareTarget
         obj[u'mod_revision'] = self.mod_revision
         return obj
@@ -589,7 +843,7 @@ class CompModified(Comp):
             _maybe_text(self.key), self.compare, self.mod_revision)
 
 
-class Op(object):
+class Op(_Marshalled):
     """
     Base class that represents a single operation within a transaction.
     """
@@ -685,7 +939,7 @@ class OpGet(Op):
         if min_mod_revision is not None and type(min_mod_revision) not in six.integer_types:
             raise TypeError('min_mod_revision must be integer, not {}'.format(type(min_mod_revision)))
 
-        if revision is not None and type(revision) not in six.integer_types:
+        if revision is not None and type(revision) not in six.integer_types and not isinstance(revision, Param):
             raise TypeError('revision must be integer, not {}'.format(type(revision)))
 
         if serializable is not None and type(serializable) != bool:
@@ -697,6 +951,12 @@ class OpGet(Op):
         if sort_order is not None and sort_order not in OpGet.SORT_ORDERS:
             raise TypeError('sort_order must be one of {}, not {}'.format(OpGet.SORT_ORDERS, sort_order))
 
+        self._init(self.key, count_only, keys_only, limit, max_create_revision, min_create_revision,
+                   min_mod_revision, revision, serializable, sort_order, sort_target)
+
+    def _init(self, key, count_only, keys_only, limit, max_create_revision, min_create_revision, min_mod_revision,
+              revision, serializable, sort_order, sort_target):
+        self.key = key
         self.count_only = count_only
         self.keys_only = keys_only
         self.limit = limit
@@ -708,39 +968,69 @@ class OpGet(Op):
         self.sort_order = sort_order
         self.sort_target = sort_target
 
-    def _marshal(self):
-        obj = {u'request_range': self.key._marshal()}
+    @staticmethod
+    def _create(key,
+                count_only=None,
+                keys_only=None,
+                limit=None,
+                max_create_revision=None,
+                min_create_revision=None,
+                min_mod_revision=None,
+                revision=None,
+                serializable=None,
+                sort_order=None,
+                sort_target=None):
+        """
+        Create a get operation without checking the arguments (for operations built by txaioetcd itself).
+
+        :param key: The key to get.
+        :type key: :class:`txaioetcd.KeySet`
+        """
+        op = OpGet.__new__(OpGet)
+        op._init(key, count_only, keys_only, limit, max_create_revision, min_create_revision, min_mod_revision,
+                 revision, serializable, sort_order, sort_target)
+        return op
+
+    def _state(self):
+        return (self.key._state(), self.count_only, self.keys_only, self.limit, self.max_create_revision,
+                self.min_create_revision, self.min_mod_revision, self.revision, self.serializable,
+                self.sort_order, self.sort_target)
+
+    def _build(self):
+        # copy: the marshalled key set is shared
+        request = dict(self.key._marshal())
+
         if self.count_only:
-            obj[u'request_range'][u'count_only'] = True
+            request[u'count_only'] = True
 
         if self.keys_only:
-            obj[u'request_range'][u'keys_only'] = True
+            request[u'keys_only'] = True
 
         if self.limit:
-            obj[u'request_range'][u'limit'] = self.limit
+            request[u'limit'] = self.limit
 
         if self.max_create_revision:
-            obj[u'request_range'][u'max_create_revision'] = self.max_create_revision
+            request[u'max_create_revision'] = self.max_create_revision
 
         if self.min_create_revision:
-            obj[u'request_range'][u'min_create_revision'] = self.min_create_revision
+            request[u'min_create_revision'] = self.min_create_revision
 
         if self.min_mod_revision:
-            obj[u'request_range'][u'min_mod_revision'] = self.min_mod_revision
+            request[u'min_mod_revision'] = self.min_mod_revision
 
         if self.revision:
-            obj[u'request_range'][u'revision'] = self.revision
+            request[u'revision'] = self.revision
 
         if self.serializable:
-            obj[u'request_range'][u'serializable'] = True
+            request[u'serializable'] = True
 
         if self.sort_order:
-            obj[u'request_range'][u'sort_order'] = self.sort_order
+            request[u'sort_order'] = self.sort_order
 
         if self.sort_target:
-            obj[u'request_range'][u'sort_target'] = self.sort_target
+            request[u'sort_target'] = self.sort_target
 
-        return obj
+        return {u'request_range': request}
 
     def __str__(self):
         return u'OpGet(key={})'.format(self.key)
@@ -771,36 +1061,46 @@ class OpSet(Op):
         if type(key) != six.binary_type:
             raise TypeError('key must be bytes type, not {}'.format(type(key)))
 
-        if type(value) != six.binary_type:
+        if type(value) != six.binary_type and not isinstance(value, Param):
             raise TypeError('value must be bytes type, not {}'.format(type(value)))
 
         # import here to break circular dep between _type.py and _lease.py
         from txaioetcd._lease import Lease
-        if lease is not None and not isinstance(lease, Lease):
+        if lease is not None and not isinstance(lease, Lease) and not isinstance(lease, Param):
             raise TypeError('lease must be a Lease object, not {}'.format(type(lease)))
 
         if return_previous is not None and type(return_previous) != bool:
             raise TypeError('return_previous must be bool, not {}'.format(type(return_previous)))
 
+        self._init(key, value, lease, return_previous)
+
+    def _init(self, key, value, lease, return_previous):
         self.key = key
         self.value = value
         self.lease = lease
         self.return_previous = return_previous
 
-    def _marshal(self):
-        obj = {
-            u'request_put': {
-                u'key': base64.b64encode(self.key).decode(),
-                u'value': base64.b64encode(self.value).decode()
-            }
-        }
+    @staticmethod
+    def _create(key, value, lease=None, return_previous=None):
+        """
+        Create a set operation without checking the arguments (for operations built by txaioetcd itself).
+        """
+        op = OpSet.__new__(OpSet)
+        op._init(key, value, lease, return_previous)
+        return op
+
+    def _state(self):
+        return self.key, self.value, self.lease.lease_id if self.lease else None, self.return_previous
+
+    def _build(self):
+        request = {u'key': _b64encode(self.key), u'value': _b64encode(self.value)}
 
         if self.lease:
-            obj[u'request_put'][u'lease'] = self.lease.lease_id
+            request[u'lease'] = self.lease.lease_id
         if self.return_previous:
-            obj[u'request_put'][u'prev_kv'] = True
+            request[u'prev_kv'] = True
 
-        return obj
+        return {u'request_put': request}
 
     def __str__(self):
         return u'OpSet(key={}, value={}, lease={}, return_previous={})'.format(
@@ -834,15 +1134,36 @@ class OpDel(Op):
         if return_previous is not None and type(return_previous) != bool:
             raise TypeError('return_previous must be bool, not {}'.format(type(return_previous)))
 
+        self._init(self.key, return_previous)
+
+    def _init(self, key, return_previous):
+        self.key = key
         self.return_previous = return_previous
 
-    def _marshal(self):
-        obj = {u'request_delete_range': self.key._marshal()}
+    @staticmethod
+    def _create(key, return_previous=None):
+        """
+        Create a delete operation without checking the arguments (for operations built by txaioetcd itself).
 
+        :param key: The key or key set to delete.
+        :type key: bytes or :class:`txaioetcd.KeySet`
+        """
+        op = OpDel.__new__(OpDel)
+        op._init(key if isinstance(key, KeySet) else KeySet._create(key), return_previous)
+        return op
+
+    def _state(self):
+        return self.key._state(), self.return_previous
+
+    def _build(self):
         if self.return_previous:
-            obj[u'request_delete_range'][u'prev_kv'] = True
+            # copy: the marshalled key set is shared
+            request = dict(self.key._marshal())
+            request[u'prev_kv'] = True
+        else:
+            request = self.key._marshal()
 
-        return obj
+        return {u'request_delete_range': request}
 
     def __str__(self):
         return u'OpDel(key={})'.format(self.key)
@@ -895,10 +1216,22 @@ class Transaction(object):
                             'failure must be a list of Op elements, but encountered element of type {}'.
                             format(type(op)))
 
+        self._init(compare, success, failure)
+
+    def _init(self, compare, success, failure):
         self.compare = compare
         self.success = success
         self.failure = failure
 
+    @staticmethod
+    def _create(compare=None, success=None, failure=None):
+        """
+        Create a transaction without checking the arguments (for transactions built by txaioetcd itself).
+        """
+        txn = Transaction.__new__(Transaction)
+        txn._init(compare, success, failure)
+        return txn
+
     def _marshal(self):
         obj = {}
         if self.compare:
@@ -909,6 +1242,31 @@ class Transaction(object):
             obj[u'failure'] = [o._marshal() for o in self.failure]
         return obj
 
+    def _encode(self):
+        return json.dumps(self._marshal(), separators=(u',', u':')).encode('utf8')
+
+    def prepare(self):
+        """
+        Prepare this transaction for repeated submission.
+
+        The transaction may contain :class:`txaioetcd.Param` slots, which are filled
+        with values when binding the prepared transaction. The structure of the
+        transaction is validated and encoded only once, here.
+
+        .. code-block:: python
+
+            cas = Transaction(
+                compare=[CompModified(b'counter', '==', Param('revision'))],
+                success=[OpSet(b'counter', Param('value'))],
+                failure=[OpGet(b'counter')]).prepare()
+
+            result = yield etcd.submit(cas.bind(revision=kv.mod_revision, value=b'42'))
+
+        :returns: The prepared transaction.
+        :rtype: instance of :class:`txaioetcd.PreparedTransaction`
+        """
+        return PreparedTransaction(self)
+
     def __str__(self):
         compare = u'[' + u', '.join(str(x) for x in self.compare) + u']' if self.compare else None
         success = u'[' + u', '.join(str(x) for x in self.success) + u']' if self.success else None
@@ -916,6 +1274,190 @@ class Transaction(object):
         return u'Transaction(compare={}, success={}, failure={})'.format(compare, success, failure)
 
 
+class _ParamLease(object):
+    # stands in for a lease in an operation when preparing a transaction
+    def __init__(self, lease_id):
+        self.lease_id = lease_id
+
+
+class PreparedTransaction(object):
+    """
+    A transaction prepared for repeated submission with different parameter values.
+
+    Create prepared transactions using :meth:`txaioetcd.Transaction.prepare`.
+    """
+
+    _BYTES = u'bytes'
+    _INT = u'int'
+    _LEASE = u'lease'
+
+    _SLOTS = {
+        CompValue: ((u'value', _BYTES), ),
+        CompVersion: ((u'version', _INT), ),
+        CompCreated: ((u'create_revision', _INT), ),
+        CompModified: ((u'mod_revision', _INT), ),
+        OpSet: ((u'value', _BYTES), (u'lease', _LEASE)),
+        OpGet: ((u'revision', _INT), ),
+    }
+    """
+    Attributes that may hold parameters (and their kind) for each transaction item type.
+    """
+
+    def __init__(self, txn):
+        """
+
+        :param txn: The transaction to prepare.
+        :type txn: instance of :class:`txaioetcd.Transaction`
+        """
+        if not isinstance(txn, Transaction):
+            raise TypeError('txn must be a Transaction, not {}'.format(type(txn)))
+
+        # parameter name -> parameter kind
+        self._params = {}
+
+        # JSON fragment -> parameter name, for the markers standing in for parameters
+        markers = {}
+
+        def substitute(item):
+            slots = PreparedTransaction._SLOTS.get(type(item), ())
+            params = [(attr, kind) for attr, kind in slots if isinstance(getattr(item, attr), Param)]
+            if not params:
+                return item
+
+            # work on a copy, so the transaction handed in is left untouched
+            item = copy.copy(item)
+            for attr, kind in params:
+                name = getattr(item, attr).name
+                if self._params.setdefault(name, kind) != kind:
+                    raise TypeError('parameter "{}" used for both {} and {} values'.format(
+                        name, self._params[name], kind))
+
+                marker = len(markers)
+                if kind == PreparedTransaction._BYTES:
+                    value = u'\0txaioetcd-param-{}\0'.format(marker).encode('utf8')
+                    fragment = u'"{}"'.format(_b64encode(value))
+                else:
+                    # large negative numbers never occur in etcd requests
+                    value = -(2**62) - marker
+                    fragment = u'{}'.format(value)
+                    if kind == PreparedTransaction._LEASE:
+                        value = _ParamLease(value)
+                markers[fragment] = name
+                setattr(item, attr, value)
+            return item
+
+        obj = Transaction._create(
+            compare=[substitute(c) for c in txn.compare] if txn.compare else None,
+            success=[substitute(o) for o in txn.success] if txn.success else None,
+            failure=[substitute(o) for o in txn.failure] if txn.failure else None)._marshal()
+        data = json.dumps(obj, separators=(u',', u':'))
+
+        # split the encoded transaction at the markers: self._segments are the constant
+        # JSON fragments, and self._slots the names of the parameters going in between
+        self._segments = []
+        self._slots = []
+        if markers:
+            pattern = re.compile(u'|'.join(re.escape(fragment) for fragment in markers))
+            pos = 0
+            for match in pattern.finditer(data):
+                self._segments.append(data[pos:match.start()])
+                self._slots.append(markers[match.group(0)])
+                pos = match.end()
+            self._segments.append(data[pos:])
+        else:
+            self._segments.append(data)
+
+        self._txn = txn
+
+    @property
+    def params(self):
+        """
+        The names of the parameters of this prepared transaction.
+
+        :rtype: set of str
+        """
+        return set(self._params.keys())
+
+    def bind(self, **params):
+        """
+        Bind values to all parameters of this prepared transaction.
+
+        :param params: The parameter values, by name. Values for ``bytes`` slots must
+            be bytes, values for versions and revisions must be integers, and values for lease
+            slots must be instances of :class:`txaioetcd.Lease`, lease IDs or None.
+
+        :returns: A transaction ready to submit with :meth:`txaioetcd.Client.submit`.
+        """
+        values = {}
+        for name, kind in self._params.items():
+            if name not in params:
+                raise TypeError('missing value for parameter "{}"'.format(name))
+            value = params[name]
+            if kind == PreparedTransaction._BYTES:
+                if type(value) != six.binary_type:
+                    raise TypeError('parameter "{}" must be bytes, not {}'.format(name, type(value)))
+                values[name] = u'"{}"'.format(_b64encode(value))
+            else:
+                if kind == PreparedTransaction._LEASE:
+                    if value is None:
+                        value = 0
+                    elif not isinstance(value, six.integer_types):
+                        value = value.lease_id
+                if type(value) not in six.integer_types:
+                    raise TypeError('parameter "{}" must be integer, not {}'.format(name, type(value)))
+                values[name] = u'{}'.format(value)
+
+        if len(params) != len(values):
+            unknown = [name for name in params if name not in self._params]
+            raise TypeError('unknown parameters {}'.format(unknown))
+
+        segments = self._segments
+        if len(segments) == 1:
+            data = segments[0]
+        else:
+            parts = [segments[0]]
+            for i, name in enumerate(self._slots):
+                parts.append(values[name])
+                parts.append(segments[i + 1])
+            data = u''.join(parts)
+
+        return _BoundTransaction(self, data.encode('utf8'))
+
+    def __str__(self):
+        return u'PreparedTransaction(params={}, txn={})'.format(sorted(self._params.keys()), self._txn)
+
+
+class _EncodedTransaction(object):
+    """
+    A transaction already encoded for submission.
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def _encode(self):
+        return self._data
+
+    def _marshal(self):
+        return json.loads(self._data.decode('utf8'))
+
+    def __str__(self):
+        return u'EncodedTransaction(data={})'.format(self._data.decode('utf8'))
+
+
+class _BoundTransaction(_EncodedTransaction):
+    """
+    A prepared transaction with values bound to its parameters.
+    """
+
+    def __init__(self, prepared, data):
+        _EncodedTransaction.__init__(self, data)
+        self._prepared = prepared
+
+    def __str__(self):
+        return u'BoundTransaction(data={})'.format(self._data.decode('utf8'))
+
+
 class Error(RuntimeError):
     """
     Error from etcd.
@@ -977,6 +1519,36 @@ class Success(object):
         return u'Success(header={}, responses={})'.format(self.header, responses)
 
 
+class CasResult(object):
+    """
+    Result of a batched compare-and-swap (see :meth:`txaioetcd.Client.cas_many`).
+
+    :ivar succeeded: Flag indicating all updates were applied.
+    :vartype succeeded: bool
+
+    :ivar revision: etcd revision of the last transaction applied (or None).
+    :vartype revision: int or None
+
+    :ivar applied: The keys updated.
+    :vartype applied: list of bytes
+
+    :ivar conflicts: The guarded keys that have changed, mapped to their current key-value
+        (or None, if the key does not exist anymore).
+    :vartype conflicts: dict
+    """
+
+    def __init__(self, succeeded, revision, applied, conflicts):
+        self.succeeded = succeeded
+        self.revision = revision
+        self.applied = applied
+        self.conflicts = conflicts
+
+    def __str__(self):
+        return u'CasResult(succeeded={}, revision={}, applied={}, conflicts={})'.format(
+            self.succeeded, self.revision, len(self.applied),
+            u'{' + u', '.join(u'{}: {}'.format(_maybe_text(key), kv) for key, kv in self.conflicts.items()) + u'}')
+
+
 class Expired(RuntimeError):
     """
     A lease has expired.
@@ -1006,12 +1578,11 @@ class Range(object):
         self.count = count
 
     @staticmethod
-    def _parse(obj):
-        count = obj.get(u'count', None)
-        header = Header._parse(obj[u'header']) if u'header' in obj else None
-        kvs = []
-        for kv in obj.get(u'kvs', []):
-            kvs.append(KeyValue._parse(kv))
+    def _parse(obj, header=None):
+        count = int(obj.get(u'count', 0))
+        if header is None and u'header' in obj:
+            header = Header._parse(obj[u'header'])
+        kvs = [KeyValue._parse(kv) for kv in obj.get(u'kvs', ())]
         return Range(kvs, header, count)
 
     def __str__(self):
@@ -0,0 +1,478 @@
+###############################################################################
+#
+# The MIT License (MIT)
+#
+# Copyright (c) Crossbar.io Technologies GmbH
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import platform
+import struct
+import sys
+import time
+
+from twisted.internet.task import react, deferLater
+from twisted.internet.defer import ensureDeferred, gatherResults
+
+import txaio
+txaio.use_twisted()  # noqa
+
+from txaioetcd import Client, KeySet, Transaction, OpSet, Database, DbTransaction, MapStringString
+from txaioetcd.cli.exporter import ADDRESS_ETCD
+from txaioetcd._version import __version__
+
+SCENARIOS = ['set', 'get', 'delete', 'submit', 'watch', 'lease', 'db-put', 'db-get']
+"""
+All available benchmark scenarios.
+"""
+
+SCENARIO_PARAMS = {
+    'set': ('concurrency', 'key_size', 'value_size'),
+    'get': ('concurrency', 'key_size', 'value_size'),
+    'delete': ('concurrency', 'key_size', 'value_size'),
+    'submit': ('concurrency', 'key_size', 'value_size', 'batch_size'),
+    'watch': ('concurrency', 'key_size', 'value_size'),
+    'lease': ('concurrency', ),
+    'db-put': ('concurrency', 'key_size', 'value_size', 'batch_size'),
+    'db-get': ('concurrency', 'key_size', 'value_size'),
+}
+"""
+The sweep parameters each scenario actually depends on. Parameters not listed for a
+scenario are not swept for it (so e.g. the "get" scenario does not run once per batch size).
+"""
+
+PERCENTILES = [(u'p50', 50.), (u'p99', 99.), (u'p999', 99.9)]
+
+
+def percentile(sorted_values, p):
+    """
+    Compute the p-th percentile (nearest-rank) of an ascending sorted list of values.
+
+    :param sorted_values: Values sorted in ascending order.
+    :type sorted_values: list of float
+
+    :param p: Percentile in [0, 100].
+    :type p: float
+
+    :returns: The percentile value or ``None`` for an empty list.
+    :rtype: float or None
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(math.ceil(len(sorted_values) * p / 100.)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, duration, ops, requests):
+    """
+    Summarize a benchmark run.
+
+    :param latencies: Per-request latencies in seconds.
+    :type latencies: list of float
+
+    :param duration: Wallclock duration of the whole run in seconds.
+    :type duration: float
+
+    :param ops: Number of logical operations (e.g. keys written) performed.
+    :type ops: int
+
+    :param requests: Number of requests issued to etcd.
+    :type requests: int
+
+    :returns: Result summary with throughput and latencies (in milliseconds).
+    :rtype: dict
+    """
+    latencies = sorted(latencies)
+    res = {
+        u'ops': ops,
+        u'requests': requests,
+        u'duration': round(duration, 6),
+        u'ops_per_sec': round(ops / duration, 2) if duration else None,
+        u'requests_per_sec': round(requests / duration, 2) if duration else None,
+        u'latency_ms': {},
+    }
+    if latencies:
+        res[u'latency_ms'][u'min'] = round(latencies[0] * 1000., 3)
+        res[u'latency_ms'][u'mean'] = round(sum(latencies) / len(latencies) * 1000., 3)
+        res[u'latency_ms'][u'max'] = round(latencies[-1] * 1000., 3)
+        for name, p in PERCENTILES:
+            res[u'latency_ms'][name] = round(percentile(latencies, p) * 1000., 3)
+    return res
+
+
+class Benchmark(object):
+    """
+    A single benchmark run of one scenario with one parameter set.
+    """
+
+    def __init__(self, reactor, client, prefix, ops, concurrency=1, key_size=16, value_size=16, batch_size=1,
+                 slot=None):
+        self._reactor = reactor
+        self._client = client
+        self._prefix = prefix
+        self._ops = ops
+        self._concurrency = concurrency
+        self._key_size = key_size
+        self._value_size = value_size
+        self._batch_size = batch_size
+        self._slot = slot
+
+        self._value = os.urandom(value_size)
+        self._latencies = []
+        self._requests = 0
+
+    def key(self, i):
+        # exactly key_size bytes: the prefix followed by the zero padded counter
+        return self._prefix + u'{:0{}d}'.format(i, self._key_size - len(self._prefix)).encode('ascii')
+
+    def text_key(self, i):
+        return u'{:0{}d}'.format(i, self._key_size)
+
+    async def _populate(self):
+        # preload all keys a read or delete scenario is going to touch
+        batch = 100
+        for i in range(0, self._ops, batch):
+            ops = [OpSet(self.key(j), self._value) for j in range(i, min(i + batch, self._ops))]
+            await self._client.submit(Transaction(success=ops))
+
+    async def _cleanup(self):
+        await self._client.delete(KeySet(self._prefix, prefix=True))
+
+    async def _run_workers(self, issue, steps):
+        """
+        Run ``concurrency`` workers which together issue all ``steps`` requests.
+
+        :param issue: Async callable issuing one request for the given step.
+        :param steps: Number of requests to issue in total.
+        """
+        counter = itertools.count()
+
+        async def worker():
+            while True:
+                i = next(counter)
+                if i >= steps:
+                    break
+                started = time.perf_counter()
+                await issue(i)
+                self._latencies.append(time.perf_counter() - started)
+                self._requests += 1
+
+        workers = [ensureDeferred(worker()) for _ in range(self._concurrency)]
+        started = time.perf_counter()
+        await gatherResults(workers, consumeErrors=True)
+        return time.perf_counter() - started
+
+    async def run_set(self):
+        async def issue(i):
+            await self._client.set(self.key(i), self._value)
+
+        duration = await self._run_workers(issue, self._ops)
+        await self._cleanup()
+        return summarize(self._latencies, duration, self._ops, self._requests)
+
+    async def run_get(self):
+        await self._populate()
+
+        async def issue(i):
+            await self._client.get(self.key(i))
+
+        duration = await self._run_workers(issue, self._ops)
+        await self._cleanup()
+        return summarize(self._latencies, duration, self._ops, self._requests)
+
+    async def run_delete(self):
+        await self._populate()
+
+        async def issue(i):
+            await self._client.delete(self.key(i))
+
+        duration = await self._run_workers(issue, self._ops)
+        await self._cleanup()
+        return summarize(self._latencies, duration, self._ops, self._requests)
+
+    async def run_submit(self):
+        steps = max(1, self._ops // self._batch_size)
+
+        async def issue(i):
+            first = i * self._batch_size
+            ops = [OpSet(self.key(j), self._value) for j in range(first, first + self._batch_size)]
+            await self._client.submit(Transaction(success=ops))
+
+        duration = await self._run_workers(issue, steps)
+        await self._cleanup()
+        return summarize(self._latencies, duration, steps * self._batch_size, self._requests)
+
+    async def run_watch(self):
+        # latency here is the time from issuing a write until the watch event is delivered
+        sent = {}
+        received = []
+        done = txaio.create_future()
+
+        def on_watch(kv):
+            started = sent.pop(kv.key, None)
+            if started is not None:
+                received.append(time.perf_counter() - started)
+                if not sent and len(received) == self._ops and not done.called:
+                    done.callback(None)
+
+        watching = self._client.watch([KeySet(self._prefix, prefix=True)], on_watch)
+
+        # give etcd a moment to create the watch before we start writing
+        await deferLater(self._reactor, .5, lambda: None)
+
+        async def issue(i):
+            key = self.key(i)
+            sent[key] = time.perf_counter()
+            await self._client.set(key, self._value)
+
+        started = time.perf_counter()
+        await self._run_workers(issue, self._ops)
+
+        # wait for outstanding events, but not forever
+        timeout = self._reactor.callLater(10, lambda: done.called or done.callback(None))
+        await done
+        if timeout.active():
+            timeout.cancel()
+        duration = time.perf_counter() - started
+
+        watching.cancel()
+        await self._cleanup()
+
+        res = summarize(received, duration, len(received), self._requests)
+        res[u'missed'] = self._ops - len(received)
+        return res
+
+    async def run_lease(self):
+        leases = []
+        for _ in range(self._concurrency):
+            lease = await self._client.lease(60)
+            leases.append(lease)
+
+        async def issue(i):
+            await leases[i % len(leases)].refresh()
+
+        duration = await self._run_workers(issue, self._ops)
+        for lease in leases:
+            await lease.revoke()
+        return summarize(self._latencies, duration, self._ops, self._requests)
+
+    async def run_db_put(self):
+        db = Database(self._client)
+        pmap = MapStringString(self._slot)
+        value = u'x' * self._value_size
+        steps = max(1, self._ops // self._batch_size)
+
+        async def issue(i):
+            first = i * self._batch_size
+            # large batches of large values exceed the etcd request limits
+            async with db.begin(write=True, oversize=DbTransaction.OVERSIZE_SPLIT) as txn:
+                for j in range(first, first + self._batch_size):
+                    pmap[txn, self.text_key(j)] = value
+
+        duration = await self._run_workers(issue, steps)
+        await self._client.delete(KeySet(struct.pack('>H', self._slot), prefix=True))
+        return summarize(self._latencies, duration, steps * self._batch_size, self._requests)
+
+    async def run_db_get(self):
+        db = Database(self._client)
+        pmap = MapStringString(self._slot)
+        value = u'x' * self._value_size
+
+        for i in range(0, self._ops, 100):
+            async with db.begin(write=True, oversize=DbTransaction.OVERSIZE_SPLIT) as txn:
+                for j in range(i, min(i + 100, self._ops)):
+                    pmap[txn, self.text_key(j)] = value
+
+        async def issue(i):
+            async with db.begin() as txn:
+                await pmap[txn, self.text_key(i)]
+
+        duration = await self._run_workers(issue, self._ops)
+        await self._client.delete(KeySet(struct.pack('>H', self._slot), prefix=True))
+        return summarize(self._latencies, duration, self._ops, self._requests)
+
+    async def run(self, scenario):
+        runner = getattr(self, 'run_{}'.format(scenario.replace('-', '_')))
+        return await runner()
+
+
+def sweep(scenarios, concurrency, key_size, value_size, batch_size):
+    """
+    Generate the (deduplicated) list of benchmark runs for the given sweep parameters.
+
+    :returns: List of ``(scenario, params)`` pairs.
+    :rtype: list of tuple
+    """
+    runs = []
+    for scenario in scenarios:
+        seen = set()
+        for c, k, v, b in itertools.product(concurrency, key_size, value_size, batch_size):
+            params = {'concurrency': c, 'key_size': k, 'value_size': v, 'batch_size': b}
+            params = {name: params[name] for name in SCENARIO_PARAMS[scenario]}
+            marker = tuple(sorted(params.items()))
+            if marker not in seen:
+                seen.add(marker)
+                runs.append((scenario, params))
+    return runs
+
+
+async def run_benchmarks(reactor, args):
+    client = Client(reactor, args.address)
+    status = await client.status()
+
+    prefix = args.prefix.encode('utf8')
+    results = []
+    for scenario, params in sweep(args.scenario, args.concurrency, args.key_size, args.value_size,
+                                  args.batch_size):
+        bench = Benchmark(reactor, client, prefix, args.ops, slot=args.slot, **params)
+        try:
+            res = await bench.run(scenario)
+        except Exception as e:
+            # record the failed run and go on, rather than losing all finished runs
+            res = {u'error': u'{}'.format(e)}
+            if args.verbose:
+                print('{:<8} {:<60} failed: {}'.format(scenario, json.dumps(params, sort_keys=True), e),
+                      file=sys.stderr)
+        res[u'scenario'] = scenario
+        res[u'params'] = params
+        results.append(res)
+        if args.verbose and u'error' not in res:
+            print(
+                '{:<8} {:<60} {:>10} ops/s  p50={} ms  p99={} ms  p99.9={} ms'.format(
+                    scenario, json.dumps(params, sort_keys=True), res[u'ops_per_sec'],
+                    res[u'latency_ms'].get(u'p50'), res[u'latency_ms'].get(u'p99'),
+                    res[u'latency_ms'].get(u'p999')),
+                file=sys.stderr)
+
+    report = {
+        u'txaioetcd': __version__,
+        u'label': args.label,
+        u'endpoint': args.address,
+        u'etcd': status.version,
+        u'python': u'{} {}'.format(platform.python_implementation(), platform.python_version()),
+        u'started': datetime.datetime.utcnow().isoformat() + u'Z',
+        u'results': results,
+    }
+
+    data = json.dumps(report, indent=4, sort_keys=True)
+    if args.output_file:
+        with open(args.output_file, 'w') as f:
+            f.write(data)
+    else:
+        print(data)
+
+
+def _int_list(value):
+    return [int(x) for x in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark etcd throughput and latency through txaioetcd.')
+
+    parser.add_argument(
+        '-a',
+        '--address',
+        help='Address(with port number) of the etcd daemon (default: {})'.format(ADDRESS_ETCD),
+        default=ADDRESS_ETCD)
+
+    parser.add_argument(
+        '-s',
+        '--scenario',
+        help='Comma separated list of scenarios to run (default: all). Available: {}'.format(
+            ', '.join(SCENARIOS)),
+        type=lambda value: value.split(','),
+        default=SCENARIOS)
+
+    parser.add_argument(
+        '-n', '--ops', help='Number of operations per benchmark run (default: 1000).', type=int, default=1000)
+
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        help='Comma separated list of concurrency levels to sweep (default: 1,8).',
+        type=_int_list,
+        default=[1, 8])
+
+    parser.add_argument(
+        '-k',
+        '--key-size',
+        help='Comma separated list of key sizes in bytes to sweep (default: 32).',
+        type=_int_list,
+        default=[32])
+
+    parser.add_argument(
+        '-v',
+        '--value-size',
+        help='Comma separated list of value sizes in bytes to sweep (default: 16,1024).',
+        type=_int_list,
+        default=[16, 1024])
+
+    parser.add_argument(
+        '-b',
+        '--batch-size',
+        help='Comma separated list of batch sizes (ops per transaction) to sweep (default: 1,16).',
+        type=_int_list,
+        default=[1, 16])
+
+    parser.add_argument(
+        '--prefix',
+        help='Key prefix under which the benchmark writes keys (default: /txaioetcd/benchmark/).',
+        default=u'/txaioetcd/benchmark/')
+
+    parser.add_argument(
+        '--slot',
+        help='Database slot used for the db-* scenarios (default: 65000).',
+        type=int,
+        default=65000)
+
+    parser.add_argument('-l', '--label', help='Label stored with the results, eg a git commit.')
+
+    parser.add_argument('-o', '--output-file', help='Path for the JSON results. When unset, output goes to stdout.')
+
+    parser.add_argument('--verbose', action='store_true', default=False, help='Print progress to stderr.')
+
+    parser.add_argument('--version', action='version', version='txaio-etcd version: {}'.format(__version__))
+
+    args = parser.parse_args()
+
+    for scenario in args.scenario:
+        if scenario not in SCENARIOS:
+            parser.error('invalid scenario "{}" (available: {})'.format(scenario, ', '.join(SCENARIOS)))
+
+    # keys are the prefix followed by a zero padded counter, and must be unique over all ops
+    min_key_size = len(args.prefix.encode('utf8')) + len(str(max(args.ops - 1, 0)))
+    for key_size in args.key_size:
+        if key_size < min_key_size:
+            parser.error('key size {} too small for prefix "{}" and {} ops (minimum: {})'.format(
+                key_size, args.prefix, args.ops, min_key_size))
+
+    react(lambda reactor: ensureDeferred(run_benchmarks(reactor, args)))
+
+
+if __name__ == '__main__':
+    main()